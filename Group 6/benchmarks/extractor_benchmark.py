@@ -0,0 +1,150 @@
+"""
+Micro-benchmark for nutrient extraction from OCR text.
+
+Times the single-pass extractor behind find_nutrition_values and
+parse_nutrition against the per-nutrient regex approach they used before
+(kept below as reference copies), on the text of synthetic labels in both
+label formats plus typical noisy OCR output. No OCR runs here, so this
+only measures the text side of a pass.
+
+Usage (from the "Group 6" directory):
+    python benchmarks/extractor_benchmark.py
+    python benchmarks/extractor_benchmark.py --number 20000
+"""
+import os
+import re
+import sys
+import random
+import timeit
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.nutrient_extractor import iter_readings, first_readings, ACCEPTED_UNITS
+
+SAMPLE_TEXTS = [
+    # Indian label, clean
+    "NUTRITION INFORMATION Per 100 g Energy (kcal) 452 Protein 6.8 g Carbohydrate 64.1 g "
+    "of which Sugars 21.3 g Dietary Fibre 2.4 g Total Fat 18.9 g Saturated Fat 8.7 g Sodium 410 mg",
+    # EU label, decimal commas
+    "Nutrition declaration per 100 g Energy 1891 kJ / 452 kcal Fat 18,9 g of which saturates 8,7 g "
+    "Carbohydrate 64,1 g of which sugars 21,3 g Fibre 2,4 g Protein 6,8 g Salt 1,03 g",
+    # Typical OCR noise: broken words, stray symbols, missing values
+    "NUTRlTION lNFORMATION (Approx) Per 100g Serve 30g %RDA Energy 452 kcal 136 kcal 6.8 "
+    "Protein 6.8g 2.0g Carbohydrate 64.1g 19.2g Sugars 21.3 g Fat 18.9g 5.7g Sodium 410mg 123mg",
+    # No nutrition table in view
+    "Best before 12 2025 Batch No 4471 Mfd by Example Foods Pvt Ltd Pune 411001 FSSAI 10012022000123",
+]
+
+
+# Reference copy of the per-nutrient approach find_nutrition_values used before
+LEGACY_FIND_PATTERNS = {
+    'energy_kcal': r'(?:energy|calories|kcal|energy value)[^\d]*(\d+[\.,]?\d*)\s*(?:kcal|kj)?',
+    'fat': r'(?:total\s*fat|fat\s*content|fat)[^\d]*(\d+[\.,]?\d*)\s*g',
+    'saturated_fat': r'(?:saturated\s*fat|saturates|sat\.\s*fat)[^\d]*(\d+[\.,]?\d*)\s*g',
+    'carbohydrates': r'(?:total\s*carbohydrate|carbohydrate|carbohydrates|carb|carbs)[^\d]*(\d+[\.,]?\d*)\s*g',
+    'sugars': r'(?:of\s*which\s*sugars|sugars?|total\s*sugars)[^\d]*(\d+[\.,]?\d*)\s*g',
+    'fiber': r'(?:dietary\s*fibre|dietary\s*fiber|fibre|fiber)[^\d]*(\d+[\.,]?\d*)\s*g',
+    'protein': r'(?:protein|proteins)[^\d]*(\d+[\.,]?\d*)\s*g',
+    'salt': r'(?:salt|sodium)[^\d]*(\d+[\.,]?\d*)\s*(?:g|mg)'
+}
+
+
+def legacy_find_nutrition_values(text):
+    results = {}
+    text = text.lower()
+    for nutrient, pattern in LEGACY_FIND_PATTERNS.items():
+        match = re.search(pattern, text)
+        if match:
+            try:
+                value = float(match.group(1).replace(',', '.'))
+                if nutrient == 'salt' and 'mg' in match.group(0):
+                    value = value / 1000
+                results[nutrient] = value
+            except (ValueError, IndexError):
+                continue
+    return results
+
+
+def legacy_parse_nutrition(text):
+    energy_matches = re.findall(
+        r'(?:Energy\s*\(?kcal\)?.*?)(\d+\.?\d*)|'
+        r'(\d+\.?\d*)\s*\(?kcal\)?(?=\s|$)',
+        text,
+        re.IGNORECASE
+    )
+    energy_values = [float(m[0] or m[1]) for m in energy_matches if any(m)]
+    nutrition = {
+        'energy_kcal': energy_values[0] if energy_values else None,
+        'sugars': None,
+        'salt': None
+    }
+    for pattern in [r'(of\s*which\s*sugars.*?)(\d+\.?\d*)\s*g', r'\bsugars?\b.*?(\d+\.?\d*)\s*g']:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            nutrition['sugars'] = float(match.groups()[-1])
+            break
+    sodium_match = re.search(r'sodium.*?(\d+\.?\d*)\s*mg', text, re.IGNORECASE)
+    if sodium_match:
+        nutrition['salt'] = float(sodium_match.group(1)) / 400
+    salt_match = re.search(r'salt.*?(\d+\.?\d*)\s*g', text, re.IGNORECASE)
+    if salt_match and not nutrition['salt']:
+        nutrition['salt'] = float(salt_match.group(1))
+    nutrient_patterns = {
+        'fat': r'(Total Fat|Fat)[^\d]*(\d+\.?\d*)',
+        'saturated_fat': r'(Saturates|Saturated Fat)[^\d]*(\d+\.?\d*)',
+        'carbohydrates': r'(Carbohydrates|Carbs)[^\d]*(\d+\.?\d*)',
+        'fiber': r'(Fibre|Fiber)[^\d]*(\d+\.?\d*)',
+        'protein': r'Protein[^\d]*(\d+\.?\d*)'
+    }
+    for nutrient, pattern in nutrient_patterns.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            try:
+                nutrition[nutrient] = float(match.group(2))
+            except IndexError:
+                continue
+    return nutrition
+
+
+def extractor_all_readings(text):
+    """What the shared extractor does for either call site: one scan."""
+    return first_readings(iter_readings(text), ACCEPTED_UNITS)
+
+
+def time_per_text(func, texts, number):
+    """Mean microseconds per call over all texts."""
+    total = timeit.timeit(lambda: [func(text) for text in texts], number=number)
+    return total / (number * len(texts)) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark nutrient extraction from OCR text.')
+    parser.add_argument('--number', type=int, default=5000, help='Repetitions over the sample texts')
+    parser.add_argument('--long', type=int, default=4, help='Also time texts this many times longer')
+    args = parser.parse_args(argv)
+
+    # Long texts stand in for full-page OCR of a whole package side
+    rng = random.Random(0)
+    long_texts = [' '.join(rng.sample(SAMPLE_TEXTS, len(SAMPLE_TEXTS)) * args.long) for _ in range(4)]
+
+    from utils.image_processing import find_nutrition_values
+    from utils.nutrition import parse_nutrition
+
+    rows = [
+        ('find_nutrition_values (legacy)', legacy_find_nutrition_values),
+        ('find_nutrition_values', find_nutrition_values),
+        ('parse_nutrition (legacy)', legacy_parse_nutrition),
+        ('parse_nutrition', parse_nutrition),
+        ('shared scan only', extractor_all_readings),
+    ]
+
+    print(f"{'':<32} {'label text us':>14} {'long text us':>13}")
+    for name, func in rows:
+        short_us = time_per_text(func, SAMPLE_TEXTS, args.number)
+        long_us = time_per_text(func, long_texts, max(1, args.number // (args.long * 2)))
+        print(f"{name:<32} {short_us:>14.1f} {long_us:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+OCR accuracy and latency benchmark.
+
+Renders a reproducible corpus of synthetic nutrition labels (see
+synthetic_labels.py) and runs the OCR pipeline over it:
+
+- pipeline mode runs extract_text end to end, exactly as an upload would
+  (with the result cache bypassed), and reports wall time plus field-level
+  precision/recall;
+- layout mode runs only the single layout-aware pass and reports how often
+  it was good enough to skip the variant passes;
+- matrix mode runs every (variant, config) pass on its own and reports the
+  latency and accuracy of each variant and each config.
+
+Usage (from the "Group 6" directory):
+    python benchmarks/ocr_benchmark.py --labels 20 --seed 7
+    python benchmarks/ocr_benchmark.py --mode matrix --json before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import cv2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_labels import generate_corpus
+from utils import image_processing, ocr_scheduler
+from utils.image_processing import (
+    NUTRIENT_FIELDS, OCR_CONFIGS, VARIANT_NAMES, VariantPipeline,
+    crop_to_nutrition_table, extract_text, layout_ocr, _ocr_job
+)
+
+
+def value_matches(predicted, expected):
+    """A reading counts as correct within 1% (or 0.05 for small values)."""
+    return abs(predicted - expected) <= max(0.05, abs(expected) * 0.01)
+
+
+class FieldScores:
+    """Field-level true positive / false positive / false negative counts."""
+
+    def __init__(self):
+        self.counts = {field: {'tp': 0, 'fp': 0, 'fn': 0} for field in NUTRIENT_FIELDS}
+
+    def add(self, predicted, truth):
+        for field in NUTRIENT_FIELDS:
+            counts = self.counts[field]
+            if field in predicted and field in truth and value_matches(predicted[field], truth[field]):
+                counts['tp'] += 1
+                continue
+            if field in predicted:
+                counts['fp'] += 1
+            if field in truth:
+                counts['fn'] += 1
+
+    @staticmethod
+    def _ratios(counts):
+        tp, fp, fn = counts['tp'], counts['fp'], counts['fn']
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        return round(precision, 3), round(recall, 3)
+
+    def summary(self):
+        totals = {'tp': 0, 'fp': 0, 'fn': 0}
+        fields = {}
+        for field, counts in self.counts.items():
+            precision, recall = self._ratios(counts)
+            fields[field] = {'precision': precision, 'recall': recall}
+            for key in totals:
+                totals[key] += counts[key]
+        precision, recall = self._ratios(totals)
+        return {'precision': precision, 'recall': recall, 'fields': fields}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def latency_summary(values):
+    return {
+        'n': len(values),
+        'mean_ms': round(sum(values) / len(values), 1) if values else 0.0,
+        'p95_ms': round(percentile(values, 95), 1),
+    }
+
+
+def run_pipeline(corpus, workdir):
+    """End-to-end extract_text over every label."""
+    scores = FieldScores()
+    timings = []
+    for i, label in enumerate(corpus):
+        path = os.path.join(workdir, f"label_{i}.png")
+        cv2.imwrite(path, label['image'])
+        start = time.perf_counter()
+        predicted = extract_text(path, use_cache=False)
+        timings.append((time.perf_counter() - start) * 1000)
+        scores.add(predicted, label['truth'])
+    return {
+        'latency': latency_summary(timings),
+        'total_wall_s': round(sum(timings) / 1000, 2),
+        'accuracy': scores.summary(),
+    }
+
+
+def run_layout(corpus):
+    """The single layout-aware pass on every label; fallbacks count as misses."""
+    scores = FieldScores()
+    timings = []
+    fallbacks = 0
+    for label in corpus:
+        pipeline = VariantPipeline(crop_to_nutrition_table(label['image']))
+        start = time.perf_counter()
+        predicted = layout_ocr(pipeline)
+        timings.append((time.perf_counter() - start) * 1000)
+        if predicted is None:
+            fallbacks += 1
+        scores.add(predicted or {}, label['truth'])
+    return {
+        'latency': latency_summary(timings),
+        'fallbacks': fallbacks,
+        'accuracy': scores.summary(),
+    }
+
+
+def run_matrix(corpus):
+    """Every (variant, config) pass on every label, one at a time."""
+    by_variant = {name: {'ms': [], 'scores': FieldScores()} for name in VARIANT_NAMES}
+    by_config = {idx: {'ms': [], 'scores': FieldScores()} for idx in range(len(OCR_CONFIGS))}
+
+    for label in corpus:
+        pipeline = VariantPipeline(crop_to_nutrition_table(label['image']))
+        for variant in VARIANT_NAMES:
+            img = pipeline.get(variant)
+            for cfg_idx in range(len(OCR_CONFIGS)):
+                _, values, elapsed_ms = _ocr_job(img, variant, cfg_idx)
+                for bucket in (by_variant[variant], by_config[cfg_idx]):
+                    bucket['ms'].append(elapsed_ms)
+                    bucket['scores'].add(values, label['truth'])
+
+    def report(buckets):
+        return {
+            str(key): {**latency_summary(bucket['ms']), **bucket['scores'].summary()}
+            for key, bucket in buckets.items()
+        }
+
+    return {'variants': report(by_variant), 'configs': report(by_config)}
+
+
+def print_report(results):
+    if 'pipeline' in results:
+        pipeline = results['pipeline']
+        accuracy = pipeline['accuracy']
+        print(f"\nPipeline: {pipeline['latency']['n']} labels in {pipeline['total_wall_s']}s "
+              f"(mean {pipeline['latency']['mean_ms']}ms, p95 {pipeline['latency']['p95_ms']}ms)")
+        print(f"  precision {accuracy['precision']}, recall {accuracy['recall']}")
+        for field, scores in accuracy['fields'].items():
+            print(f"  {field:<15} P={scores['precision']:<6} R={scores['recall']}")
+
+    if 'layout' in results:
+        layout = results['layout']
+        print(f"\nLayout pass: mean {layout['latency']['mean_ms']}ms, p95 {layout['latency']['p95_ms']}ms, "
+              f"{layout['fallbacks']} of {layout['latency']['n']} labels fell back to the variant passes")
+        print(f"  precision {layout['accuracy']['precision']}, recall {layout['accuracy']['recall']}")
+
+    if 'matrix' in results:
+        for title, rows in (('Variant', results['matrix']['variants']), ('Config', results['matrix']['configs'])):
+            print(f"\n{title:<16} {'mean ms':>9} {'p95 ms':>9} {'prec':>6} {'recall':>6}")
+            for key, row in rows.items():
+                print(f"{key:<16} {row['mean_ms']:>9} {row['p95_ms']:>9} {row['precision']:>6} {row['recall']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark OCR accuracy and latency on synthetic labels.')
+    parser.add_argument('--labels', type=int, default=20, help='Number of synthetic labels')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus seed')
+    parser.add_argument('--mode', choices=['pipeline', 'layout', 'matrix', 'all'], default='all')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    corpus = generate_corpus(args.labels, args.seed)
+    results = {'labels': args.labels, 'seed': args.seed, 'pipeline_id': image_processing.pipeline_id()}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Start from an empty scheduler so earlier runs don't change the pass order
+        ocr_scheduler._scheduler = ocr_scheduler.OCRScheduler(os.path.join(workdir, 'stats.json'))
+        if args.mode in ('pipeline', 'all'):
+            results['pipeline'] = run_pipeline(corpus, workdir)
+        if args.mode in ('layout', 'all'):
+            results['layout'] = run_layout(corpus)
+        if args.mode in ('matrix', 'all'):
+            results['matrix'] = run_matrix(corpus)
+
+    results['benchmark_wall_s'] = round(time.perf_counter() - started, 2)
+    print_report(results)
+    print(f"\nTotal benchmark time: {results['benchmark_wall_s']}s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
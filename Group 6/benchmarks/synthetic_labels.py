@@ -0,0 +1,168 @@
+"""
+Synthetic nutrition label generator for the OCR benchmarks.
+
+Labels are drawn with OpenCV's built-in Hershey fonts, so no font files
+are needed, and every label comes with the values the OCR pipeline is
+expected to read from it. The same seed always produces the same corpus.
+"""
+import random
+import cv2
+import numpy as np
+
+FONTS = [
+    cv2.FONT_HERSHEY_SIMPLEX,
+    cv2.FONT_HERSHEY_DUPLEX,
+    cv2.FONT_HERSHEY_COMPLEX,
+    cv2.FONT_HERSHEY_TRIPLEX,
+    cv2.FONT_HERSHEY_PLAIN,
+]
+
+LABEL_FORMATS = ['indian', 'eu']
+
+
+def random_values(rng):
+    """Plausible per-100g values, keyed like find_nutrition_values' output."""
+    fat = round(rng.uniform(0, 35), 1)
+    carbohydrates = round(rng.uniform(5, 85), 1)
+    return {
+        'energy_kcal': float(rng.randint(40, 580)),
+        'fat': fat,
+        'saturated_fat': round(rng.uniform(0, fat), 1),
+        'carbohydrates': carbohydrates,
+        'sugars': round(rng.uniform(0, carbohydrates), 1),
+        'fiber': round(rng.uniform(0, 12), 1),
+        'protein': round(rng.uniform(0.5, 30), 1),
+        'salt': round(rng.uniform(0.05, 2.5), 2),
+    }
+
+
+def label_rows(values, label_format):
+    """
+    Text rows of a label as (name, value) pairs.
+
+    Ground truth follows the pipeline's conventions: sodium printed in mg is
+    expected back as mg / 1000 under 'salt', and EU labels use decimal commas.
+    """
+    if label_format == 'indian':
+        sodium_mg = int(round(values['salt'] * 1000))
+        return [
+            ('NUTRITION INFORMATION', ''),
+            ('Per 100 g', ''),
+            ('Energy (kcal)', f"{values['energy_kcal']:.0f}"),
+            ('Protein', f"{values['protein']} g"),
+            ('Carbohydrate', f"{values['carbohydrates']} g"),
+            ('of which Sugars', f"{values['sugars']} g"),
+            ('Dietary Fibre', f"{values['fiber']} g"),
+            ('Total Fat', f"{values['fat']} g"),
+            ('Saturated Fat', f"{values['saturated_fat']} g"),
+            ('Sodium', f"{sodium_mg} mg"),
+        ]
+
+    def comma(value):
+        return str(value).replace('.', ',')
+
+    return [
+        ('Nutrition declaration', ''),
+        ('per 100 g', ''),
+        ('Energy', f"{values['energy_kcal'] * 4.184:.0f} kJ / {values['energy_kcal']:.0f} kcal"),
+        ('Fat', f"{comma(values['fat'])} g"),
+        ('of which saturates', f"{comma(values['saturated_fat'])} g"),
+        ('Carbohydrate', f"{comma(values['carbohydrates'])} g"),
+        ('of which sugars', f"{comma(values['sugars'])} g"),
+        ('Fibre', f"{comma(values['fiber'])} g"),
+        ('Protein', f"{comma(values['protein'])} g"),
+        ('Salt', f"{comma(values['salt'])} g"),
+    ]
+
+
+def truth_for(values, label_format):
+    """Values the pipeline should report for a label."""
+    truth = dict(values)
+    if label_format == 'indian':
+        truth['salt'] = int(round(values['salt'] * 1000)) / 1000
+    return truth
+
+
+def render_table(rows, font, scale=1.0):
+    """Draw rows as a ruled two-column table on a white canvas."""
+    thickness = 2 if font != cv2.FONT_HERSHEY_PLAIN else 1
+    row_height = int(48 * scale)
+    width = int(760 * scale)
+    height = row_height * len(rows) + int(20 * scale)
+    table = np.full((height, width), 255, np.uint8)
+
+    for i, (name, value) in enumerate(rows):
+        baseline = int(10 * scale) + row_height * (i + 1) - int(14 * scale)
+        cv2.putText(table, name, (int(16 * scale), baseline), font, 0.9 * scale, 0, thickness, cv2.LINE_AA)
+        if value:
+            (text_w, _), _ = cv2.getTextSize(value, font, 0.9 * scale, thickness)
+            cv2.putText(table, value, (width - text_w - int(16 * scale), baseline),
+                        font, 0.9 * scale, 0, thickness, cv2.LINE_AA)
+        rule_y = int(10 * scale) + row_height * (i + 1)
+        cv2.line(table, (0, rule_y), (width, rule_y), 0, 2)
+
+    cv2.rectangle(table, (0, 0), (width - 1, height - 1), 0, 3)
+    return cv2.cvtColor(table, cv2.COLOR_GRAY2BGR)
+
+
+def place_on_package(table, rng):
+    """Put the table on a larger, busy 'package' background."""
+    h, w = table.shape[:2]
+    canvas_h, canvas_w = int(h * rng.uniform(1.6, 2.4)), int(w * rng.uniform(1.6, 2.4))
+    canvas = np.full((canvas_h, canvas_w, 3), [rng.randint(120, 255) for _ in range(3)], np.uint8)
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randint(0, canvas_w), rng.randint(0, canvas_h)
+        color = [rng.randint(0, 255) for _ in range(3)]
+        cv2.circle(canvas, (x0, y0), rng.randint(20, canvas_w // 4), color, -1)
+    x, y = rng.randint(0, canvas_w - w), rng.randint(0, canvas_h - h)
+    canvas[y:y + h, x:x + w] = table
+    return canvas
+
+
+def distort(image, np_rng, blur, noise, angle):
+    """Apply rotation, blur and sensor noise."""
+    if angle:
+        h, w = image.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        image = cv2.warpAffine(image, matrix, (w, h), borderValue=(255, 255, 255))
+    if blur:
+        image = cv2.GaussianBlur(image, (blur, blur), 0)
+    if noise:
+        grain = np_rng.normal(0, noise, image.shape)
+        image = np.clip(image.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+    return image
+
+
+def generate_corpus(count, seed=0):
+    """
+    Generate a reproducible corpus of synthetic labels.
+
+    Args:
+        count: Number of labels
+        seed: Random seed; the same seed always yields the same corpus
+
+    Returns:
+        list: Dicts with 'image' (BGR array), 'truth' (expected values) and
+            'meta' (format, font, distortions) entries
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.RandomState(seed)
+    corpus = []
+    for i in range(count):
+        label_format = LABEL_FORMATS[i % len(LABEL_FORMATS)]
+        font = FONTS[rng.randrange(len(FONTS))]
+        values = random_values(rng)
+        meta = {
+            'format': label_format,
+            'font': font,
+            'blur': rng.choice([0, 0, 3, 5]),
+            'noise': rng.choice([0, 0, 8, 16]),
+            'angle': round(rng.uniform(-4, 4), 1) if rng.random() < 0.5 else 0,
+            'on_package': rng.random() < 0.5,
+        }
+        image = render_table(label_rows(values, label_format), font, scale=rng.uniform(0.8, 1.4))
+        if meta['on_package']:
+            image = place_on_package(image, rng)
+        image = distort(image, np_rng, meta['blur'], meta['noise'], meta['angle'])
+        corpus.append({'image': image, 'truth': truth_for(values, label_format), 'meta': meta})
+    return corpus
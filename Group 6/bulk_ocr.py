@@ -0,0 +1,157 @@
+"""
+Bulk nutrition-label OCR.
+
+Runs every image in a directory (or listed in a manifest) through the same
+OCR pipeline as /product/upload_file and streams one JSON line per image
+with the extracted values, the computed Nutri-Score and the time it took.
+
+The output file doubles as the checkpoint: re-running with the same output
+skips every image whose content hash is already in it, so an interrupted
+run picks up where it stopped. Images that failed with an error are tried
+again.
+
+Usage:
+    python bulk_ocr.py shelf_photos/ -o results.jsonl
+    python bulk_ocr.py manifest.txt -o results.jsonl --workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add src directory to Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from utils.common import allowed_file, content_hash
+
+
+def collect_images(source):
+    """
+    List the images to process.
+
+    Args:
+        source: A directory (searched recursively) or a manifest file with
+            one image path per line, relative to the manifest's directory
+
+    Returns:
+        list: Image paths in a stable order
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if allowed_file(name):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+
+def load_checkpoint(output_path):
+    """Content hashes of the images already processed (not failed) in an output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Partially written last line of an interrupted run
+            if record.get('sha256') and record.get('status') != 'error':
+                done.add(record['sha256'])
+    return done
+
+
+def init_worker():
+    """Each image already gets its own process, so run its OCR passes in-process."""
+    from utils import ocr_executor
+    ocr_executor.OCR_WORKERS = 1
+
+
+def process_image(path):
+    """OCR one label image. Runs inside a pool worker."""
+    from utils.image_processing import extract_text
+    from utils.nutrition import calculate_nutri_score
+
+    start = time.perf_counter()
+    # Errors (including every OCR pass failing) are raised and reported as such
+    nutrition = extract_text(path, raise_errors=True)
+    rejection = nutrition.pop('quality_error', None)
+    record = {
+        'nutrition': nutrition,
+        'nutri_score': calculate_nutri_score(nutrition) if nutrition else None,
+        'status': 'ok' if nutrition else 'rejected' if rejection else 'no_values',
+    }
+    if rejection:
+        record['rejection'] = rejection
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run nutrition-label OCR over many images.')
+    parser.add_argument('source', help='Directory of images or manifest file (one path per line)')
+    parser.add_argument('-o', '--output', default='ocr_results.jsonl', help='JSONL output / checkpoint file')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Images processed in parallel')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and overwrite the output')
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+
+    # Hash up front so duplicates and already-processed images are skipped
+    todo = {}
+    skipped = 0
+    for path in collect_images(args.source):
+        try:
+            with open(path, 'rb') as f:
+                digest = content_hash(f.read())
+        except OSError as e:
+            print(f"Cannot read {path}: {str(e)}", file=sys.stderr)
+            continue
+        if digest in done or digest in todo:
+            skipped += 1
+            continue
+        todo[digest] = path
+
+    print(f"{len(todo)} images to process, {skipped} skipped (already done or duplicate)", file=sys.stderr)
+
+    started = time.perf_counter()
+    processed = failed = 0
+    with open(args.output, 'a', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+        futures = {pool.submit(process_image, path): (digest, path) for digest, path in todo.items()}
+        for future in as_completed(futures):
+            digest, path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {'nutrition': {}, 'nutri_score': None, 'status': 'error', 'error': str(e)}
+                failed += 1
+            record = {'path': path, 'sha256': digest, **record}
+
+            # One line per image, flushed so the file is a usable checkpoint at any time
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            processed += 1
+            print(f"[{processed}/{len(todo)}] {path}: {record['status']} "
+                  f"({record.get('seconds', 0)}s)", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    print(f"Done: {processed} images in {elapsed:.1f}s, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
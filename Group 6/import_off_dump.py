@@ -0,0 +1,57 @@
+"""
+Import an Open Food Facts data export into the local product mirror.
+
+Takes the JSONL product dump, the tab-separated CSV export (either may be
+gzipped) or a daily delta file, and stores the fields the app reads in
+src/instance/off_mirror.sqlite3 (or EATFIT_OFF_MIRROR). Product lookups use
+the mirror before the live API.
+
+Imports are incremental: products already in the mirror are only replaced
+by a newer copy, so the same command applies delta files on top of a full
+dump.
+
+Usage:
+    python import_off_dump.py openfoodfacts-products.jsonl.gz
+    python import_off_dump.py en.openfoodfacts.org.products.csv.gz --restart
+"""
+import os
+import sys
+import time
+import argparse
+
+# Add src directory to Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from utils.off_client import ALL_PRODUCT_FIELDS
+from utils.off_mirror import OFFMirror, OFF_MIRROR_PATH
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import an Open Food Facts export into the local mirror.')
+    parser.add_argument('dump', nargs='+', help='JSONL or CSV export files (optionally .gz), applied in order')
+    parser.add_argument('--mirror', default=OFF_MIRROR_PATH, help='Mirror database file')
+    parser.add_argument('--restart', action='store_true', help='Empty the mirror before importing')
+    args = parser.parse_args(argv)
+
+    mirror = OFFMirror(args.mirror)
+    if args.restart:
+        mirror.clear()
+
+    started = time.perf_counter()
+
+    def progress(read, written):
+        print(f"\r{read} products read, {written} written ({time.perf_counter() - started:.0f}s)",
+              end='', file=sys.stderr)
+
+    for path in args.dump:
+        print(f"Importing {path}", file=sys.stderr)
+        counts = mirror.import_dump(path, ALL_PRODUCT_FIELDS, progress)
+        print(f"\n{path}: {counts['read']} products read, {counts['written']} new or updated, "
+              f"{counts['skipped']} without a barcode", file=sys.stderr)
+
+    print(f"Done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import click
 from flask import Flask, g, redirect, url_for, request, jsonify, flash
 from flask_mysqldb import MySQL
 from flask_bcrypt import Bcrypt
@@ -11,6 +12,9 @@ from database.db import init_app
 
 # Import cart blueprint
 from cart import CartBlueprint
+from utils.uploads import UPLOAD_DIR, start_sweeper
+from utils.product_cache import get_product_cache
+from utils.alternatives_index import get_alternatives_index, rebuild_index, watch_index
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -29,13 +33,16 @@ app.secret_key = os.urandom(24)
 app.config.update(DB_CONFIG)
 
 # Configuration for file upload
-UPLOAD_FOLDER = os.path.join('src', 'static', 'uploads')
+UPLOAD_FOLDER = UPLOAD_DIR
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(os.path.join('src', 'static', 'images'), exist_ok=True)
 
+# Expire old uploads and debug artifacts in the background
+start_sweeper()
+
 # Initialize extensions
 mysql = MySQL(app)
 bcrypt = Bcrypt(app)
@@ -68,6 +75,22 @@ app.register_blueprint(user_bp, url_prefix='/user')
 app.register_blueprint(product_bp, url_prefix='/product')
 app.register_blueprint(diet_bp, url_prefix='/diet')
 
+@app.cli.command('invalidate-product-cache')
+@click.argument('barcode', required=False)
+def invalidate_product_cache(barcode):
+    """Forget one cached Open Food Facts product, or all of them."""
+    get_product_cache().invalidate(barcode)
+    print(f"Invalidated cached product {barcode}" if barcode else "Invalidated all cached products")
+
+@app.cli.command('build-alternatives-index')
+@click.option('--watch', is_flag=True, help='Keep running and rebuild the index whenever it is due.')
+def build_alternatives_index(watch):
+    """Rebuild the healthier-alternatives index from the mirror and cached products."""
+    if watch:
+        watch_index(get_alternatives_index())
+    else:
+        rebuild_index(get_alternatives_index())
+
 # Default route
 @app.route('/')
 def index():
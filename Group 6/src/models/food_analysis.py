@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from typing import List, Dict, Optional
 from enum import Enum
-import requests
+from utils.off_client import get_off_client, PRODUCT_FIELDS, ALL_PRODUCT_FIELDS
 
 class ProcessingLevel(Enum):
     UNPROCESSED = 1
@@ -254,13 +254,15 @@ def process_ingredients_tags(tags):
         return []
     return [extract_code_from_tag(tag) for tag in tags]
 
-def get_product_from_off(barcode):
+def get_product_from_off(barcode, fields=None):
     """
     Get product information from the Open Food Facts API.
     This function processes and cleans up the data before returning it.
     
     Args:
         barcode (str): The product barcode to fetch
+        fields (list): The caller's field manifest (see PRODUCT_FIELDS);
+            defaults to every declared field
         
     Returns:
         dict: Dictionary containing cleaned and processed product data or None if not found
@@ -269,18 +271,10 @@ def get_product_from_off(barcode):
         if not barcode or len(barcode) < 8:
             return None
             
-        url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
-        response = requests.get(url)
-        
-        if response.status_code != 200:
-            return None
-            
-        data = response.json()
-        
-        if data.get('status') != 1 or 'product' not in data:
+        fields = PRODUCT_FIELDS['get_product_from_off'] + list(fields or ALL_PRODUCT_FIELDS)
+        product = get_off_client().get_product(barcode, fields)
+        if not product:
             return None
-            
-        product = data['product']
         
         # Process additives comprehensively
         if 'additives_tags' in product:
@@ -374,7 +368,7 @@ def analyze_product_with_off(barcode):
     """
     try:
         # Get product information from Open Food Facts API
-        product = get_product_from_off(barcode)
+        product = get_product_from_off(barcode, PRODUCT_FIELDS['analyze_product_with_off'])
         
         if not product:
             return None
@@ -1,18 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g, jsonify, Response, send_from_directory, abort
 from werkzeug.utils import secure_filename
 import os
 import io
 from utils.common import allowed_file
-from utils.image_processing import OCR_CONFIGS, extract_text
+from utils.image_processing import OCR_CONFIGS, OCR_TIME_BUDGET, extract_text, load_image, read_barcode
 from utils.nutrition import (
     parse_nutrition, process_with_config, calculate_nutri_score,
     get_alternatives_by_category, merge_nutrition_data, get_nova_score
 )
 from utils.allergies import map_allergens_to_ingredients
 from utils.conclusion import check_product_safety
+from utils.job_queue import get_job_queue, QueueFullError
+from utils.uploads import get_upload_store
 from models.food_analysis import get_product_from_off, analyze_product_with_off, ProductAnalysis
+from utils.off_client import PRODUCT_FIELDS
 import logging
 import json
+import uuid
 import requests
 
 # Set up logging
@@ -172,11 +176,12 @@ def upload_file():
                 return render_template("upload.html")
 
             try:
-                # Save the uploaded file
-                filename = secure_filename(file.filename)
-                app_config = g.app.config
-                upload_path = os.path.join(app_config['UPLOAD_FOLDER'], filename)
-                file.save(upload_path)
+                # Keep the upload in memory for OCR; the copy on disk is written in the background,
+                # named by content so duplicates are stored once
+                image_data = file.read()
+                store = get_upload_store()
+                filename = store.save(image_data, secure_filename(file.filename))
+                upload_path = store.path(filename)
                 
                 # Store file information in session
                 session['file_path'] = upload_path
@@ -190,36 +195,188 @@ def upload_file():
                 else:
                     session.pop('barcode', None)
                 
-                # Process the image with OCR
-                nutrition_data = process_with_config(upload_path, 0)
+                # Process the image with OCR in the background
+                session['nutrition'] = {}
+                job_id = get_job_queue().submit(run_upload_job, upload_path, barcode, image_data=image_data)
+                session['upload_job_id'] = job_id
                 
-                if isinstance(nutrition_data, dict) and not nutrition_data.get('error'):
-                    # If we have a barcode, try to get additional data
-                    if barcode:
-                        analysis = analyze_product_with_off(barcode)
-                        if analysis:
-                            analysis_dict = analysis.to_dict()
-                            # Merge OCR data with API data
-                            nutrition_data.update(analysis_dict)
-                            session['product_name'] = analysis_dict.get('product_name')
-                            session['brand'] = analysis_dict.get('brand')
-                            flash(f"Found product: {analysis_dict.get('product_name')}", "success")
-                    
-                    session['nutrition'] = nutrition_data
-                    flash("Image processed successfully! Please verify the extracted information.", "success")
-                else:
-                    session['nutrition'] = {}
-                    error_msg = nutrition_data.get('error', 'Failed to extract nutrition information')
-                    flash(f"OCR processing issue: {error_msg}. Please enter the values manually.", "warning")
+                if request.accept_mimetypes.best == 'application/json':
+                    return jsonify({
+                        'job_id': job_id,
+                        'status_url': url_for('product.upload_status', job_id=job_id),
+                        'events_url': url_for('product.upload_events', job_id=job_id),
+                        'result_url': url_for('product.upload_result', job_id=job_id)
+                    }), 202
                     
                 return redirect(url_for('product.verify_extraction'))
                 
+            except QueueFullError as e:
+                flash(str(e), "error")
+                return render_template("upload.html")
             except Exception as e:
                 flash(f"Error processing upload: {str(e)}", "error")
                 return render_template("upload.html")
 
     return render_template("upload.html")
 
+def run_upload_job(upload_path, barcode, progress, image_data=None):
+    """
+    Background part of an image upload: OCR plus the optional barcode lookup.
+    Runs on the job queue, so it must not touch the session; the result is
+    copied into the session by upload_result. OCR works on image_data when
+    given, so it doesn't wait for the upload to reach the disk.
+    
+    Without a barcode from the form, the photo itself is checked for one
+    first; if it names a product the lookup knows, OCR is skipped and the
+    result takes the barcode-only path.
+    """
+    # Hold on to the upload while the job runs, so the sweeper leaves it alone
+    store = get_upload_store()
+    name = os.path.basename(upload_path)
+    owner = f"job-{uuid.uuid4().hex}"
+    store.acquire(name, owner)
+    try:
+        return _process_upload(upload_path, barcode, progress, image_data)
+    finally:
+        store.release(name, owner)
+
+def _process_upload(upload_path, barcode, progress, image_data):
+    result = {'nutrition': {}, 'messages': []}
+    image = None
+    photo_barcode = None
+    
+    if not barcode:
+        progress("Looking for a barcode")
+        # Decoded once, for the barcode and then for OCR
+        image = load_image(upload_path, image_data)
+        found = read_barcode(image)
+        if found:
+            progress("Looking up product details")
+            analysis = analyze_product_with_off(found)
+            if analysis:
+                analysis_dict = analysis.to_dict()
+                result.update({
+                    'nutrition': analysis_dict,
+                    'product_name': analysis_dict.get('product_name', 'Unknown Product'),
+                    'brand': analysis_dict.get('brand', 'Unknown Brand'),
+                    'barcode': found,
+                    'from_barcode_only': True,
+                })
+                result['messages'].append(("success", f"Found product from the barcode in your photo: {result['product_name']} by {result['brand']}"))
+                progress("Done")
+                return result
+            # Not a product the lookup knows; OCR reads the label, but the barcode is kept
+            photo_barcode = result['barcode'] = found
+    
+    progress("Reading nutrition label")
+    nutrition_data = process_with_config(upload_path, 0, barcode=photo_barcode, progress=progress,
+                                         image_data=image_data, budget=OCR_TIME_BUDGET, image=image)
+    
+    if isinstance(nutrition_data, dict) and not nutrition_data.get('error'):
+        # If we have a barcode, try to get additional data
+        if barcode:
+            progress("Looking up product details")
+            analysis = analyze_product_with_off(barcode)
+            if analysis:
+                analysis_dict = analysis.to_dict()
+                # Merge OCR data with API data
+                nutrition_data.update(analysis_dict)
+                result['product_name'] = analysis_dict.get('product_name')
+                result['brand'] = analysis_dict.get('brand')
+                result['messages'].append(("success", f"Found product: {analysis_dict.get('product_name')}"))
+        
+        result['nutrition'] = nutrition_data
+        if nutrition_data.get('ocr_partial'):
+            result['messages'].append(("warning", "Reading the label took too long, so some values may be missing. Please check them carefully."))
+        else:
+            result['messages'].append(("success", "Image processed successfully! Please verify the extracted information."))
+    else:
+        error_msg = nutrition_data.get('error', 'Failed to extract nutrition information').rstrip('.')
+        result['messages'].append(("warning", f"OCR processing issue: {error_msg}. Please enter the values manually."))
+    
+    progress("Done")
+    return result
+
+@product_bp.route("/upload_status/<job_id>")
+def upload_status(job_id):
+    """Current status of a background upload job."""
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+@product_bp.route("/upload_events/<job_id>")
+def upload_events(job_id):
+    """Server-sent events stream with the progress of a background upload job."""
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    
+    def stream():
+        last_seq = 0
+        while True:
+            events = job.wait_for_change(last_seq, timeout=15)
+            for seq, message in events:
+                last_seq = seq
+                yield f"id: {seq}\nevent: progress\ndata: {json.dumps({'message': message})}\n\n"
+            if job.is_finished:
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            if not events:
+                # Keep-alive comment so proxies don't close the connection
+                yield ": keep-alive\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@product_bp.route("/upload_result/<job_id>")
+def upload_result(job_id):
+    """Copy the result of a finished upload job into the session and show it for verification."""
+    if session.get('upload_job_id') != job_id:
+        flash("This upload does not belong to the current session", "error")
+        return redirect(url_for('product.upload_file'))
+    
+    job = get_job_queue().get(job_id)
+    if not job:
+        session.pop('upload_job_id', None)
+        flash("The upload expired before it was processed. Please upload the image again.", "error")
+        return redirect(url_for('product.upload_file'))
+    
+    if not job.is_finished:
+        return redirect(url_for('product.verify_extraction'))
+    
+    session.pop('upload_job_id', None)
+    if job.status == 'failed':
+        session['nutrition'] = {}
+        flash(f"OCR processing issue: {job.error}. Please enter the values manually.", "warning")
+        return redirect(url_for('product.verify_extraction'))
+    
+    result = job.result
+    session['nutrition'] = result['nutrition']
+    if result.get('product_name'):
+        session['product_name'] = result['product_name']
+        session['brand'] = result.get('brand')
+    for category, message in result['messages']:
+        flash(message, category)
+    
+    if result.get('barcode'):
+        session['barcode'] = result['barcode']
+    
+    # The photo showed the barcode of a known product, so OCR was skipped
+    if result.get('from_barcode_only'):
+        session['from_barcode_only'] = True
+        return redirect(url_for('product.product_details'))
+    
+    return redirect(url_for('product.verify_extraction'))
+
+@product_bp.route("/uploads/<path:filename>")
+def uploaded_image(filename):
+    """Serve an uploaded image, waiting for its background write if needed."""
+    store = get_upload_store()
+    if not store.wait(filename):
+        abort(404)
+    store.touch(filename)
+    return send_from_directory(os.path.abspath(store.directory), filename)
+
 @product_bp.route("/verify", methods=["GET", "POST"])
 def verify_extraction():
     if 'file_path' not in session or 'filename' not in session:
@@ -281,14 +438,16 @@ def verify_extraction():
                 
             return redirect(url_for('product.product_details'))
         else:
-            # Try another OCR configuration
+            # Try another OCR configuration (0 is the full pipeline, see process_with_config)
             current_idx = session.get('current_config_idx', 0)
-            new_idx = (current_idx + 1) % len(OCR_CONFIGS)
+            new_idx = (current_idx + 1) % (len(OCR_CONFIGS) + 1)
             
             try:
                 session['current_config_idx'] = new_idx
                 barcode = session.get('barcode', None)
-                nutrition_data = process_with_config(session['file_path'], new_idx, barcode)
+                get_upload_store().wait(session['filename'])
+                nutrition_data = process_with_config(session['file_path'], new_idx, barcode,
+                                                     budget=OCR_TIME_BUDGET)
                 
                 # Make sure the result is a dictionary
                 if isinstance(nutrition_data, dict) and not nutrition_data.get('error'):
@@ -299,10 +458,10 @@ def verify_extraction():
                         session['product_name'] = nutrition_data.get('product_name')
                         session['brand'] = nutrition_data.get('brand', 'Unknown Brand')
                         
-                    flash(f"Tried OCR configuration #{new_idx+1}. Please verify the extracted values.", "info")
+                    flash(f"Tried OCR configuration #{new_idx}. Please verify the extracted values.", "info")
                 else:
-                    error_msg = nutrition_data.get('error', 'No nutrition data extracted')
-                    flash(f"OCR configuration #{new_idx+1} failed: {error_msg}. Please try another or enter values manually.", "warning")
+                    error_msg = nutrition_data.get('error', 'No nutrition data extracted').rstrip('.')
+                    flash(f"OCR configuration #{new_idx} failed: {error_msg}. Please try another or enter values manually.", "warning")
                     # Keep previous nutrition data if available
                     if 'nutrition' not in session:
                         session['nutrition'] = {}
@@ -315,6 +474,7 @@ def verify_extraction():
     
     # Get session values with defaults
     nutrition = session.get('nutrition', {})
+    job_id = session.get('upload_job_id')
     config_number = session.get('current_config_idx', 0) + 1
     
     # Check if product info from barcode is available
@@ -329,12 +489,16 @@ def verify_extraction():
         flash("Image not found", "error")
         return redirect(url_for('product.upload_file'))
     
+    # The session is still using its upload, keep it from expiring
+    get_upload_store().touch(filename)
+    
     return render_template(
         "verify.html",
         image=filename,
         nutrition=nutrition,
         config_number=config_number,
-        product_info=product_info
+        product_info=product_info,
+        job_id=job_id
     )
 
 @product_bp.route("/product_details")
@@ -357,7 +521,7 @@ def product_details():
             
             # Get fresh data directly from OpenFoodFacts
             try:
-                product = get_product_from_off(barcode)
+                product = get_product_from_off(barcode, PRODUCT_FIELDS['product_details'])
                 
                 if product:
                     logger.info(f"Got fresh data from API for barcode {barcode}")
@@ -1,7 +1,7 @@
 import pandas as pd
 import os
 import logging
-import requests
+from utils.off_client import get_off_client, PRODUCT_FIELDS
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -46,13 +46,11 @@ except Exception as e:
 
 def fetch_ingredients_from_barcode(barcode):
     """Fetch ingredients from Open Food Facts API"""
-    api_url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
     try:
-        response = requests.get(api_url)
-        data = response.json()
+        product = get_off_client().get_product(barcode, PRODUCT_FIELDS['allergies'])
         
-        if data.get("status") == 1:  # Product found
-            ingredients_text = data["product"].get("ingredients_text", "")
+        if product:  # Product found
+            ingredients_text = product.get("ingredients_text", "")
             ingredient_list = [ing.strip() for ing in ingredients_text.split(",") if ing.strip()]
             return ingredient_list
         return None
@@ -0,0 +1,259 @@
+"""
+Precomputed index of the healthiest products in each category.
+
+Finding alternatives used to mean several live Open Food Facts searches on
+every request. Instead, a background job goes through every product the app
+has locally (the OFF mirror, if one was imported, and the products cached
+from earlier lookups) and keeps, for each category tag, the best
+ALTERNATIVES_PER_CATEGORY products with a Nutri-Score of A or B: best
+grade first, then least processed (NOVA group), then least sugar and salt
+and most fibre and protein. The alternatives page then reads a few rows by
+category from a SQLite file.
+
+The app only reads the index. It is built by `flask build-alternatives-index`,
+run by hand, from cron, or kept running with --watch to rebuild it every
+ALTERNATIVES_INDEX_INTERVAL_SECONDS; a lock file keeps two builds from
+running at once. A rebuild replaces the whole index in one transaction, so
+readers never see it half built.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from utils.common import INSTANCE_DIR
+from utils.off_client import SEARCH_FIELDS
+from utils.off_mirror import get_off_mirror
+from utils.product_cache import get_product_cache
+from utils.single_flight import FileLock, LOCK_DIR
+
+# Where the index lives
+ALTERNATIVES_INDEX_PATH = os.path.join(INSTANCE_DIR, 'alternatives_index.sqlite3')
+
+# Products kept per category; more than are shown, since the current product
+# and products that are no better than it are filtered out when reading
+ALTERNATIVES_PER_CATEGORY = 20
+
+# Nutri-Score grades a product needs to be an alternative
+ALTERNATIVE_GRADES = ('a', 'b')
+
+# Time between two rebuilds with --watch, and between two checks whether one is due
+ALTERNATIVES_INDEX_INTERVAL_SECONDS = int(os.environ.get('EATFIT_ALTERNATIVES_INDEX_INTERVAL', 6 * 60 * 60))
+ALTERNATIVES_INDEX_CHECK_SECONDS = 15 * 60
+
+# How long a build waits for the build lock; if another process holds it,
+# that one does the rebuild. A build that outlasts LOCK_STALE_SECONDS may be
+# repeated by another process, which is harmless: each build is one transaction
+ALTERNATIVES_BUILD_LOCK_WAIT = 1
+
+
+def _nutrient(product, key):
+    try:
+        return float(product.get('nutriments', {}).get(key) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def rank_key(product):
+    """Sort key of a candidate; smaller is healthier."""
+    try:
+        nova = int(product.get('nova_group') or 4)
+    except (TypeError, ValueError):
+        nova = 4
+    return (
+        product['nutrition_grades'],
+        nova,
+        _nutrient(product, 'sugars_100g') + _nutrient(product, 'salt_100g'),
+        -(_nutrient(product, 'fiber_100g') + _nutrient(product, 'proteins_100g')),
+    )
+
+
+def candidate(barcode, product):
+    """
+    Reduce a product to what the alternatives page needs.
+
+    Returns:
+        tuple: (categories, candidate), or None if the product can't be an
+            alternative (grade not A/B, or no name, image or nutrients)
+    """
+    grade = str(product.get('nutrition_grades') or '').lower()
+    if (grade not in ALTERNATIVE_GRADES or not product.get('product_name') or
+            not product.get('image_url') or not product.get('nutriments')):
+        return None
+    categories = list(dict.fromkeys(
+        list(product.get('categories_hierarchy') or []) + list(product.get('categories_tags') or [])
+    ))
+    if not categories:
+        return None
+    kept = {field: product[field] for field in SEARCH_FIELDS if field in product}
+    kept['code'] = barcode
+    kept['nutrition_grades'] = grade
+    return categories, kept
+
+
+class AlternativesIndex:
+    """SQLite table of the top products per category, rebuilt by build()."""
+
+    def __init__(self, path=ALTERNATIVES_INDEX_PATH, per_category=ALTERNATIVES_PER_CATEGORY):
+        self.path = path
+        self.per_category = per_category
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS alternatives ('
+                'category TEXT NOT NULL, rank INTEGER NOT NULL, product TEXT NOT NULL, '
+                'PRIMARY KEY (category, rank))'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def built_at(self):
+        """When the index was last built (time.time()), or None if never."""
+        try:
+            row = self._connection().execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        except sqlite3.Error as e:
+            print(f"Alternatives index read error: {str(e)}")
+            return None
+        return float(row[0]) if row else None
+
+    def lookup(self, categories):
+        """
+        Get the indexed products of some categories.
+
+        Args:
+            categories: Category tags, most relevant first
+
+        Returns:
+            list: Products (healthiest first within each category, categories
+                in the given order, no duplicates); empty if none are indexed
+        """
+        products = {}
+        try:
+            conn = self._connection()
+            for category in categories:
+                for row in conn.execute(
+                        'SELECT product FROM alternatives WHERE category = ? ORDER BY rank', (category,)):
+                    product = json.loads(row[0])
+                    products.setdefault(product['code'], product)
+        except sqlite3.Error as e:
+            print(f"Alternatives index read error: {str(e)}")
+            return []
+        return list(products.values())
+
+    def build(self, sources):
+        """
+        Rebuild the index.
+
+        Args:
+            sources: Iterables of (barcode, product); a barcode found in
+                several of them is taken from the first
+
+        Returns:
+            dict: Counts of products read, candidates and categories indexed
+        """
+        counts = {'read': 0, 'candidates': 0, 'categories': 0}
+        seen = set()
+        best = {}  # category -> list of (rank key, barcode, candidate)
+
+        for source in sources:
+            for barcode, product in source:
+                counts['read'] += 1
+                if barcode in seen:
+                    continue
+                seen.add(barcode)
+                found = candidate(barcode, product)
+                if found is None:
+                    continue
+                counts['candidates'] += 1
+                categories, kept = found
+                entry = (rank_key(kept), barcode, kept)
+                for category in categories:
+                    entries = best.setdefault(category, [])
+                    entries.append(entry)
+                    if len(entries) >= 2 * self.per_category:
+                        # Trim now and then, so big categories stay small in memory
+                        entries.sort(key=lambda e: e[:2])
+                        del entries[self.per_category:]
+
+        rows = []
+        for category, entries in best.items():
+            entries.sort(key=lambda e: e[:2])
+            for rank, (_, _, kept) in enumerate(entries[:self.per_category]):
+                rows.append((category, rank, json.dumps(kept, separators=(',', ':'))))
+        counts['categories'] = len(best)
+
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM alternatives')
+            conn.executemany('INSERT INTO alternatives (category, rank, product) VALUES (?, ?, ?)', rows)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', ?)", (str(time.time()),))
+        return counts
+
+
+def local_products():
+    """The product sources the index is built from: the mirror, then cached lookups."""
+    return [get_off_mirror().products(), get_product_cache().products()]
+
+
+def rebuild_index(index, max_age=None):
+    """
+    Rebuild the index, unless another process is rebuilding it already.
+
+    Args:
+        index: The AlternativesIndex to rebuild
+        max_age: Skip the rebuild if the index is younger than this (seconds)
+
+    Returns:
+        dict: Counts from AlternativesIndex.build(), or None if skipped
+    """
+    def fresh():
+        built = index.built_at()
+        return max_age is not None and built is not None and time.time() - built < max_age
+
+    if fresh():
+        return None
+    lock = FileLock(os.path.join(LOCK_DIR, 'alternatives-index.lock'))
+    if not lock.acquire(timeout=ALTERNATIVES_BUILD_LOCK_WAIT):
+        print("Alternatives index is being rebuilt by another process")
+        return None
+    try:
+        if fresh():
+            return None
+        started = time.perf_counter()
+        counts = index.build(local_products())
+        print(f"Built alternatives index: {counts['candidates']} of {counts['read']} products "
+              f"in {counts['categories']} categories ({time.perf_counter() - started:.1f}s)")
+        return counts
+    finally:
+        lock.release()
+
+
+def watch_index(index, interval=ALTERNATIVES_INDEX_INTERVAL_SECONDS):
+    """Keep rebuilding the index whenever it is older than interval; never returns."""
+    while True:
+        try:
+            rebuild_index(index, max_age=interval)
+        except Exception as e:
+            print(f"Alternatives index error: {str(e)}")
+        time.sleep(min(interval, ALTERNATIVES_INDEX_CHECK_SECONDS))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_alternatives_index():
+    """Get the process-wide alternatives index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = AlternativesIndex()
+        return _index
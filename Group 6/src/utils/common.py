@@ -1,6 +1,11 @@
 """
 Common utility functions used across the application.
 """
+import os
+import hashlib
+
+# Local runtime data (caches, statistics, indexes); not tracked by git
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
 
 def allowed_file(filename):
     """
@@ -13,4 +18,16 @@ def allowed_file(filename):
         bool: True if the file extension is allowed, False otherwise
     """
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS 
\ No newline at end of file
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def content_hash(data):
+    """
+    Compute the content hash used to identify identical files.
+    
+    Args:
+        data: The raw file bytes
+        
+    Returns:
+        str: Hex SHA-256 digest of the bytes
+    """
+    return hashlib.sha256(data).hexdigest()
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Asynchronous sink for OCR debug artifacts.
+
+Preprocessed images and raw OCR text are handed to a background writer
+thread through a bounded queue, so the request path never waits on disk.
+Only a sampled fraction of uploads produce artifacts, the image directory
+and the log file are capped in size, and the whole thing can be switched
+off with EATFIT_DEBUG_ARTIFACTS=0.
+"""
+import os
+import queue
+import random
+import threading
+import time
+import cv2
+
+# Off switch and fraction of uploads whose artifacts are kept
+DEBUG_ENABLED = os.environ.get('EATFIT_DEBUG_ARTIFACTS', '1') != '0'
+DEBUG_SAMPLE_RATE = float(os.environ.get('EATFIT_DEBUG_SAMPLE_RATE', '0.05'))
+
+# Where artifacts go (relative to the working directory, as before)
+DEBUG_IMAGES_DIR = 'debug_images'
+DEBUG_LOG_PATH = 'ocr_debug.log'
+
+# Size caps: oldest images are deleted, the log is rotated
+DEBUG_IMAGES_MAX_BYTES = 200 * 1024 * 1024
+DEBUG_LOG_MAX_BYTES = 10 * 1024 * 1024
+DEBUG_LOG_BACKUPS = 3
+
+# Artifacts waiting to be written; further ones are dropped when full
+DEBUG_QUEUE_SIZE = 256
+
+
+class DebugSink:
+    """Background writer for sampled, size-capped debug artifacts."""
+
+    def __init__(self, enabled=DEBUG_ENABLED, sample_rate=DEBUG_SAMPLE_RATE,
+                 images_dir=DEBUG_IMAGES_DIR, log_path=DEBUG_LOG_PATH):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.images_dir = images_dir
+        self.log_path = log_path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=DEBUG_QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._images = None  # [(path, size)] oldest first, loaded by the writer
+        self._images_bytes = 0
+
+    def sample(self):
+        """
+        Decide whether one upload should produce debug artifacts.
+
+        Returns:
+            bool: True for a sampled upload, False otherwise or when disabled
+        """
+        return self.enabled and random.random() < self.sample_rate
+
+    def save_image(self, filename, img):
+        """Queue an image to be written into the debug images directory."""
+        self._offer(('image', filename, img))
+
+    def log(self, text):
+        """Queue text to be appended to the OCR debug log."""
+        self._offer(('log', text, None))
+
+    def expire(self, max_age):
+        """Queue removal of debug images and rotated logs older than max_age seconds."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(('expire', max_age, None))
+        except queue.Full:
+            pass  # The next sweep will catch up
+
+    def flush(self):
+        """Block until every queued artifact has been written (used by tools and tests)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _offer(self, item):
+        if not self.enabled:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Never make a request wait for debug output
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='debug-sink', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            kind, payload, img = self._queue.get()
+            try:
+                if kind == 'image':
+                    self._write_image(payload, img)
+                elif kind == 'expire':
+                    self._expire(payload)
+                else:
+                    self._write_log(payload)
+            except Exception as e:
+                print(f"Debug sink write error: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _load_images(self):
+        os.makedirs(self.images_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.images_dir):
+            path = os.path.join(self.images_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        self._images = [(path, size) for _, path, size in entries]
+        self._images_bytes = sum(size for _, size in self._images)
+
+    def _write_image(self, filename, img):
+        if self._images is None:
+            self._load_images()
+
+        path = os.path.join(self.images_dir, filename)
+        if not cv2.imwrite(path, img):
+            return
+        size = os.path.getsize(path)
+        self._images.append((path, size))
+        self._images_bytes += size
+
+        while self._images_bytes > DEBUG_IMAGES_MAX_BYTES and len(self._images) > 1:
+            old_path, old_size = self._images.pop(0)
+            self._images_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def _expire(self, max_age):
+        cutoff = time.time() - max_age
+        if os.path.isdir(self.images_dir):
+            if self._images is None:
+                self._load_images()
+            # Oldest first, so stop at the first image that is recent enough
+            while self._images:
+                path, size = self._images[0]
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        break
+                    os.remove(path)
+                except OSError:
+                    pass
+                self._images.pop(0)
+                self._images_bytes -= size
+
+        for i in range(1, DEBUG_LOG_BACKUPS + 1):
+            backup = f"{self.log_path}.{i}"
+            try:
+                if os.path.getmtime(backup) < cutoff:
+                    os.remove(backup)
+            except OSError:
+                pass
+
+    def _write_log(self, text):
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= DEBUG_LOG_MAX_BYTES:
+            # ocr_debug.log -> ocr_debug.log.1 -> ... -> ocr_debug.log.N (dropped)
+            for i in range(DEBUG_LOG_BACKUPS - 1, 0, -1):
+                older = f"{self.log_path}.{i}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.log_path}.{i + 1}")
+            os.replace(self.log_path, f"{self.log_path}.1")
+
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(text)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_debug_sink():
+    """Get the process-wide debug artifact sink."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = DebugSink()
+        return _sink
@@ -3,200 +3,884 @@ Image processing utilities for OCR.
 """
 import os
 import cv2
-import pytesseract
 import re
 import numpy as np
 import time
+import json
+import hashlib
+import logging
+import uuid
+import struct
+from collections import Counter
+from utils.common import content_hash
+from utils.ocr_backends import get_backend
+from utils.ocr_executor import fan_out
+from utils.ocr_scheduler import get_scheduler
+from utils.ocr_cache import get_ocr_cache
+from utils.debug_sink import get_debug_sink
+from utils.nutrient_extractor import iter_readings, first_readings, find_label
+from utils.quality_gate import check_image
 
-# OCR Configuration
+logger = logging.getLogger(__name__)
+
+# Bump when decoding, the quality gate, enhance_image, find_nutrition_values or the layout pass change, to invalidate cached OCR results
+OCR_PIPELINE_VERSION = 7
+
+# Nutrients extracted by find_nutrition_values
+NUTRIENT_FIELDS = [
+    'energy_kcal', 'fat', 'saturated_fat', 'carbohydrates',
+    'sugars', 'fiber', 'protein', 'salt'
+]
+
+# Names of the variants produced by enhance_image, in order
+VARIANT_NAMES = [
+    'gray', 'bilateral', 'clahe', 'adaptive', 'otsu',
+    'adaptive_open', 'adaptive_close', 'otsu_open', 'otsu_close', 'edges'
+]
+
+# Number of identical readings needed before a nutrient value is trusted
+OCR_AGREEMENT = 2
+
+# Stop OCR once this fraction of nutrients has an agreeing value
+OCR_CONFIDENCE_THRESHOLD = 0.75
+
+# Stop OCR after this many passes in a row read nothing new
+OCR_STALL_PASSES = 8
+
+# Nutrition table detection: working width, minimum table size and crop margin
+TABLE_DETECTION_WIDTH = 1000
+TABLE_MIN_AREA_RATIO = 0.04
+TABLE_MIN_ROWS = 3
+TABLE_PADDING_RATIO = 0.02
+
+# Default time limit (seconds) for OCR behind an interactive request
+OCR_TIME_BUDGET = float(os.environ.get('EATFIT_OCR_TIME_BUDGET', '45'))
+
+# Photos whose long side is at least twice this are decoded at reduced resolution
+UPLOAD_DECODE_MAX_SIDE = 2000
+
+# Barcode lengths read from photos: EAN-8, UPC-A and EAN-13
+BARCODE_LENGTHS = (8, 12, 13)
+
+# Layout pass: one word-box OCR of the table, tried before the multi-variant passes
+LAYOUT_VARIANT = 'gray'
+LAYOUT_CONFIG = {
+    'oem': 3,
+    'psm': 11,  # Sparse text: find every word, rows and columns are rebuilt from the boxes
+    'extra': '-l eng'
+}
+LAYOUT_MIN_WORD_CONF = 30
+# Fewer nutrients than this from the rebuilt table means the layout was not understood
+LAYOUT_MIN_NUTRIENTS = 5
+
+# OCR Configuration (the tessdata directory is set apart, see TESSDATA_DIR in utils.ocr_backends)
 OCR_CONFIGS = [
     # Config 1: Optimized specifically for nutrition labels with columnar data
     {
         'oem': 1,  # Legacy engine (sometimes more accurate for tabular data)
         'psm': 4,  # Assume single column of text with variable sizes
-        'extra': '--tessdata-dir "C:\\Program Files\\Tesseract-OCR\\tessdata" -l eng --dpi 300'
+        'extra': '-l eng --dpi 300'
     },
     
     # Config 2: LSTM neural network with single column assumption
     {
         'oem': 3,  # LSTM neural net only
         'psm': 6,  # Assume a single uniform block of text
-        'extra': '-c tessedit_char_whitelist="0123456789.,ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz() " --tessdata-dir "C:\\Program Files\\Tesseract-OCR\\tessdata" -l eng'
+        'extra': '-c tessedit_char_whitelist="0123456789.,ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz() " -l eng'
     },
     
     # Config 3: Optimized for numerical values and measurements
     {
         'oem': 3,
         'psm': 11,  # Sparse text with OSD
-        'extra': '-c tessedit_char_whitelist="0123456789.,g% " --tessdata-dir "C:\\Program Files\\Tesseract-OCR\\tessdata" -l eng'
+        'extra': '-c tessedit_char_whitelist="0123456789.,g% " -l eng'
     },
     
     # Config 4: High accuracy mode for structured text
     {
         'oem': 1,
         'psm': 3,  # Fully automatic page segmentation
-        'extra': '--tessdata-dir "C:\\Program Files\\Tesseract-OCR\\tessdata" -l eng'
+        'extra': '-l eng'
     }
 ]
 
-def enhance_image(image):
+def image_size(data):
     """
-    Enhanced image processing specifically for Indian nutrition labels
+    Read the width and height of a PNG or JPEG from its header, without decoding it.
+    
+    Returns:
+        tuple: (width, height), or None for other formats or broken headers
     """
-    # Make a copy to avoid modifying the original
-    img = image.copy()
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
     
-    # Resize if image is too small
-    height, width = img.shape[:2]
-    if width < 800 or height < 600:
-        scale_factor = max(800 / width, 600 / height)
-        img = cv2.resize(img, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
+    if data[:2] != b'\xff\xd8':
+        return None
+    # Walk the JPEG segments up to the start-of-frame marker
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1  # Fill byte
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+def decode_image(data):
+    """
+    Decode image bytes held in memory.
     
-    # Try multiple preprocessing techniques to increase OCR accuracy
-    processed_images = []
+    Large photos are decoded straight to a half, quarter or eighth of their
+    size (never below UPLOAD_DECODE_MAX_SIDE on the long side), which is much
+    faster than decoding at full size and scaling down afterwards.
     
-    # 1. Basic grayscale conversion
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    processed_images.append(gray)
+    Args:
+        data: The raw file bytes
+        
+    Returns:
+        numpy.ndarray: BGR image, or None if the bytes could not be decoded
+    """
+    flag = cv2.IMREAD_COLOR
+    size = image_size(data)
+    if size:
+        long_side = max(size)
+        for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                     (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                     (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if long_side // factor >= UPLOAD_DECODE_MAX_SIDE:
+                flag = reduced_flag
+                print(f"Decoding {size[0]}x{size[1]} image at 1/{factor} resolution")
+                break
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+
+def is_valid_barcode(code):
+    """
+    Check that a code is an EAN-8, UPC-A or EAN-13 with a correct check digit.
+    """
+    if not code or not code.isdigit() or len(code) not in BARCODE_LENGTHS:
+        return False
+    digits = [int(c) for c in code]
+    check = digits.pop()
+    # Weights alternate 3, 1, ... starting next to the check digit
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10 == check
+
+def detect_barcode(image):
+    """
+    Decode a product barcode shown in a photo with OpenCV's barcode detector.
     
-    # 2. Bilateral filter to preserve edges while removing noise
-    blurred = cv2.bilateralFilter(gray, 9, 75, 75)
-    processed_images.append(blurred)
+    Needs an OpenCV build with the barcode module (opencv-python 4.8+ or
+    opencv-contrib-python); without it no barcode is ever found.
+    
+    Args:
+        image: BGR image
+        
+    Returns:
+        str: The first valid EAN/UPC code in the photo, or None
+    """
+    if image is None or not hasattr(cv2, 'barcode'):
+        return None
+    
+    try:
+        detector = cv2.barcode.BarcodeDetector()
+        if hasattr(detector, 'detectAndDecodeWithType'):
+            ok, codes, _, _ = detector.detectAndDecodeWithType(image)
+        else:
+            # OpenCV before 4.8 returns the types from detectAndDecode
+            ok, codes, _, _ = detector.detectAndDecode(image)
+    except cv2.error as e:
+        print(f"Barcode detection failed: {str(e)}")
+        return None
     
+    if not ok:
+        return None
+    for code in codes:
+        if is_valid_barcode(code):
+            return code
+    return None
+
+def load_image(image_path, data=None):
+    """
+    Decode an uploaded image, from its bytes if they are already in memory.
+    
+    Decodes the same way extract_text does, so the image can be handed to
+    it (and to read_barcode) instead of being decoded again.
+    
+    Returns:
+        numpy.ndarray: BGR image, or None if it could not be read or decoded
+    """
+    if data is None:
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Could not read image {image_path}: {str(e)}")
+            return None
+    return decode_image(data)
+
+def read_barcode(image):
+    """
+    Look for a product barcode in an uploaded image before running any OCR.
+    
+    Args:
+        image: The decoded image (see load_image)
+        
+    Returns:
+        str: The barcode, or None if there is none (or it could not be read)
+    """
+    start = time.perf_counter()
+    barcode = detect_barcode(image)
+    print(f"Barcode detection took {(time.perf_counter() - start) * 1000:.0f}ms: {barcode or 'none found'}")
+    return barcode
+
+def locate_nutrition_table(image):
+    """
+    Find the bounding box of the nutrition facts table in a package photo.
+    
+    Works on a downscaled copy: long horizontal and vertical strokes are
+    extracted with morphology, merged into a grid mask, and the largest grid
+    region with at least TABLE_MIN_ROWS row rules is taken as the table.
+    
+    Args:
+        image: BGR or grayscale image
+        
+    Returns:
+        tuple: (x, y, w, h) in full-resolution pixels, or None if no table was found
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, TABLE_DETECTION_WIDTH / width)
+    small = image
+    if scale < 1.0:
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    
+    # Dark strokes on light background become white on black
+    binary = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    small_h, small_w = binary.shape
+    
+    # Keep only long horizontal / vertical runs, i.e. table rules
+    h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(small_w // 15, 10), 1))
+    v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(small_h // 15, 10)))
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, h_kernel)
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, v_kernel)
+    grid = cv2.dilate(cv2.bitwise_or(horizontal, vertical), np.ones((5, 5), np.uint8), iterations=2)
+    
+    rules, _ = cv2.findContours(horizontal, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rule_centres = [(x + w / 2, y + h / 2) for x, y, w, h in map(cv2.boundingRect, rules)]
+    
+    contours, _ = cv2.findContours(grid, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    best = None
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        area_ratio = (w * h) / float(small_w * small_h)
+        if area_ratio < TABLE_MIN_AREA_RATIO or area_ratio > 0.95:
+            continue
+        rows = sum(1 for cx, cy in rule_centres if x <= cx <= x + w and y <= cy <= y + h)
+        if rows < TABLE_MIN_ROWS:
+            continue
+        if best is None or w * h > best[2] * best[3]:
+            best = (x, y, w, h)
+    
+    if best is None:
+        return None
+    
+    # Back to full resolution, with a small margin around the table
+    x, y, w, h = (int(round(v / scale)) for v in best)
+    pad_x = int(width * TABLE_PADDING_RATIO)
+    pad_y = int(height * TABLE_PADDING_RATIO)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    return x0, y0, x1 - x0, y1 - y0
+
+def crop_to_nutrition_table(image):
+    """
+    Crop an image to its nutrition facts table.
+    Falls back to the full image when no table can be found.
+    """
+    try:
+        box = locate_nutrition_table(image)
+    except cv2.error as e:
+        print(f"Table detection error: {str(e)}")
+        box = None
+    
+    if box is None:
+        print("No nutrition table found, using the full image")
+        return image
+    
+    x, y, w, h = box
+    print(f"Nutrition table found at {box}, cropping {image.shape[1]}x{image.shape[0]} -> {w}x{h}")
+    return image[y:y + h, x:x + w]
+
+# Small structuring element shared by the morphology variants
+MORPH_KERNEL = np.ones((2, 2), np.uint8)
+
+def _to_gray(img):
+    # 1. Basic grayscale conversion
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+def _bilateral(gray):
+    # 2. Bilateral filter to preserve edges while removing noise
+    return cv2.bilateralFilter(gray, 9, 75, 75)
+
+def _clahe(blurred):
     # 3. Apply CLAHE for better contrast
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(blurred)
-    processed_images.append(enhanced)
-    
+    return clahe.apply(blurred)
+
+def _adaptive_threshold(enhanced):
     # 4. Apply adaptive thresholding
-    binary_adaptive = cv2.adaptiveThreshold(
+    return cv2.adaptiveThreshold(
         enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-    processed_images.append(binary_adaptive)
-    
+
+def _otsu_threshold(enhanced):
     # 5. Apply Otsu thresholding
     _, binary_otsu = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    processed_images.append(binary_otsu)
+    return binary_otsu
+
+def _opening(binary):
+    # 6a. Noise removal (opening)
+    return cv2.morphologyEx(binary, cv2.MORPH_OPEN, MORPH_KERNEL, iterations=1)
+
+def _closing(opening):
+    # 6b. Connect text (closing)
+    return cv2.morphologyEx(opening, cv2.MORPH_CLOSE, MORPH_KERNEL, iterations=1)
+
+def _edge_enhance(enhanced):
+    # 7. Apply edge enhancement; the Canny output buffer is reused in place
+    edges = cv2.Canny(enhanced, 50, 150)
+    cv2.dilate(edges, MORPH_KERNEL, dst=edges, iterations=1)
+    cv2.bitwise_not(edges, dst=edges)
+    return edges
+
+# How each variant is derived: name -> (input variant, builder)
+VARIANT_BUILDERS = {
+    'gray': ('base', _to_gray),
+    'bilateral': ('gray', _bilateral),
+    'clahe': ('bilateral', _clahe),
+    'adaptive': ('clahe', _adaptive_threshold),
+    'otsu': ('clahe', _otsu_threshold),
+    'adaptive_open': ('adaptive', _opening),
+    'adaptive_close': ('adaptive_open', _closing),
+    'otsu_open': ('otsu', _opening),
+    'otsu_close': ('otsu_open', _closing),
+    'edges': ('clahe', _edge_enhance),
+}
+
+class VariantPipeline:
+    """
+    Lazily computed preprocessing variants of one image.
+    
+    A variant is only built when it is first requested, and every
+    intermediate it depends on is built once and shared. When the request
+    order is known up front (see stream), each buffer is dropped right after
+    its last use, so only the variants still needed stay in memory.
+    """
     
-    # 6. Apply morphological operations to both thresholded images
-    for binary in [binary_adaptive, binary_otsu]:
-        # Noise removal (opening)
-        kernel = np.ones((2, 2), np.uint8)
-        opening = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
-        processed_images.append(opening)
+    def __init__(self, image, debug=False):
+        # Resize if image is too small
+        height, width = image.shape[:2]
+        if width < 800 or height < 600:
+            scale_factor = max(800 / width, 600 / height)
+            image = cv2.resize(image, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
         
-        # Connect text (closing)
-        kernel = np.ones((2, 2), np.uint8)
-        closing = cv2.morphologyEx(opening, cv2.MORPH_CLOSE, kernel, iterations=1)
-        processed_images.append(closing)
+        self._buffers = {'base': image}
+        
+        # Sampled uploads keep their variants in debug_images/
+        self.debug = debug
+        self._debug_tag = f"{int(time.time())}_{uuid.uuid4().hex[:6]}"
     
-    # 7. Apply edge enhancement
-    edges = cv2.Canny(enhanced, 50, 150)
-    dilated_edges = cv2.dilate(edges, np.ones((2,2), np.uint8), iterations=1)
-    edge_enhanced = cv2.bitwise_not(dilated_edges)
-    processed_images.append(edge_enhanced)
+    def get(self, name):
+        """Get a variant by name, building it (and its inputs) if needed."""
+        if name not in self._buffers:
+            source, builder = VARIANT_BUILDERS[name]
+            self._buffers[name] = builder(self.get(source))
+            if self.debug:
+                get_debug_sink().save_image(f"process_{name}_{self._debug_tag}.jpg", self._buffers[name])
+        return self._buffers[name]
     
-    # Save debug images
-    debug_dir = os.path.join('debug_images')
-    if not os.path.exists(debug_dir):
-        os.makedirs(debug_dir)
+    def _release_schedule(self, names):
+        """
+        Work out after which request each buffer can be dropped.
+        
+        A buffer is needed until its own last request and until every
+        variant derived from it has been built for the first time.
+        """
+        first_use, last_use = {}, {}
+        for step, name in enumerate(names):
+            first_use.setdefault(name, step)
+            last_use[name] = step
+        
+        # Children come after their inputs in VARIANT_BUILDERS, so walk it backwards
+        for name in reversed(list(VARIANT_BUILDERS)):
+            source = VARIANT_BUILDERS[name][0]
+            if name in first_use:
+                first_use[source] = min(first_use.get(source, first_use[name]), first_use[name])
+                last_use[source] = max(last_use.get(source, first_use[name]), first_use[name])
+        return last_use
     
-    timestamp = int(time.time())
-    for i, img in enumerate(processed_images):
-        cv2.imwrite(f"{debug_dir}/process_{i}_{timestamp}.jpg", img)
+    def stream(self, names):
+        """
+        Yield (name, image) for each requested variant, in the given order.
+        
+        Names may repeat. Buffers are released as soon as no later request needs them.
+        """
+        names = list(names)
+        last_use = self._release_schedule(names)
+        for step, name in enumerate(names):
+            yield name, self.get(name)
+            for buffered in list(self._buffers):
+                if last_use.get(buffered, -1) <= step:
+                    del self._buffers[buffered]
+
+def enhance_image(image):
+    """
+    Enhanced image processing specifically for Indian nutrition labels
     
-    return processed_images
+    Returns a generator of (name, image) pairs, one per VARIANT_NAMES entry,
+    built on demand.
+    """
+    return VariantPipeline(image).stream(VARIANT_NAMES)
 
 def find_nutrition_values(text):
     """
-    Extract nutrition values from OCR text using regex patterns tailored for nutrition labels,
-    with special attention to Indian nutrition label formats
-    """
-    # Extended patterns for better matching of Indian nutrition labels
-    patterns = {
-        'energy_kcal': r'(?:energy|calories|kcal|energy value)[^\d]*(\d+[\.,]?\d*)\s*(?:kcal|kj)?',
-        'fat': r'(?:total\s*fat|fat\s*content|fat)[^\d]*(\d+[\.,]?\d*)\s*g',
-        'saturated_fat': r'(?:saturated\s*fat|saturates|sat\.\s*fat)[^\d]*(\d+[\.,]?\d*)\s*g',
-        'carbohydrates': r'(?:total\s*carbohydrate|carbohydrate|carbohydrates|carb|carbs)[^\d]*(\d+[\.,]?\d*)\s*g',
-        'sugars': r'(?:of\s*which\s*sugars|sugars?|total\s*sugars)[^\d]*(\d+[\.,]?\d*)\s*g',
-        'fiber': r'(?:dietary\s*fibre|dietary\s*fiber|fibre|fiber)[^\d]*(\d+[\.,]?\d*)\s*g',
-        'protein': r'(?:protein|proteins)[^\d]*(\d+[\.,]?\d*)\s*g',
-        'salt': r'(?:salt|sodium)[^\d]*(\d+[\.,]?\d*)\s*(?:g|mg)'
-    }
-    
+    Extract nutrition values from OCR text, with special attention to Indian
+    nutrition label formats. The text is scanned once by the shared nutrient
+    extractor; salt or sodium printed in mg is converted to g.
+    """
     results = {}
-    text = text.lower()
-    
-    # Print the text for debugging
-    print("OCR Text for analysis:")
-    print(text)
-    
-    for nutrient, pattern in patterns.items():
-        match = re.search(pattern, text)
-        if match:
-            try:
-                # Handle potential comma as decimal separator
-                value_text = match.group(1).replace(',', '.')
-                value = float(value_text)
-                
-                # Special case for salt/sodium conversion
-                if nutrient == 'salt' and 'mg' in match.group(0):
-                    value = value / 1000  # Convert mg to g
-                
-                results[nutrient] = value
-                print(f"Found {nutrient}: {value}")
-            except (ValueError, IndexError) as e:
-                print(f"Error parsing {nutrient}: {e}")
+    for nutrient, (value, unit) in first_readings(iter_readings(text)).items():
+        # Whichever of salt / sodium is printed first is reported as salt
+        if nutrient in ('salt', 'sodium'):
+            if 'salt' in results:
                 continue
+            nutrient = 'salt'
+            if unit == 'mg':
+                value = value / 1000  # Convert mg to g
+        results[nutrient] = value
+        logger.debug("Found %s: %s", nutrient, value)
+
+    return results
+
+def _ocr_job(img, variant, cfg_idx):
+    """
+    Run a single (image variant, OCR config) pass.
+    Executed inside an OCR worker process, so it must stay a top-level function.
+    """
+    start = time.perf_counter()
+    text = get_backend().image_to_string(img, OCR_CONFIGS[cfg_idx])
     
+    # Clean OCR text
+    text = re.sub(r'\s+', ' ', text).strip()
+    
+    # Extract nutrition values
+    values = find_nutrition_values(text)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return text, values, elapsed_ms
+
+def ocr_confidence(readings):
+    """
+    Estimate how complete the OCR readings are.
+    
+    Args:
+        readings: Dict mapping nutrient name to the list of values read so far
+        
+    Returns:
+        float: Fraction of nutrients with one value seen OCR_AGREEMENT times
+    """
+    agreed = 0
+    for nutrient in NUTRIENT_FIELDS:
+        values = readings.get(nutrient)
+        if values and Counter(values).most_common(1)[0][1] >= OCR_AGREEMENT:
+            agreed += 1
+    return agreed / len(NUTRIENT_FIELDS)
+
+def settle_readings(readings):
+    """
+    Pick one value per nutrient from all OCR readings.
+    The most frequent positive reading wins; zero is only used when nothing else was read.
+    """
+    results = {}
+    for nutrient, values in readings.items():
+        positive = [v for v in values if v > 0]
+        results[nutrient] = Counter(positive or values).most_common(1)[0][0]
     return results
 
-def enhanced_ocr(processed_images):
+def enhanced_ocr(pipeline, progress=None, configs=None, per_config=None, deadline=None, errors=None):
     """
     Perform OCR with multiple configurations and images for best results.
+    
+    The (image, config) passes are ordered by the adaptive scheduler, fanned
+    out across the OCR process pool, and the remaining passes are cancelled
+    once OCR_CONFIDENCE_THRESHOLD is reached or the passes stop finding
+    anything new. Variants are pulled from the VariantPipeline only as worker
+    slots free up, and released after their last pass is handed out.
+    
+    With a deadline, whatever was read when it passes is returned; since the
+    scheduler puts the most productive passes first, that is usually most
+    of the label.
+    
+    Args:
+        pipeline: VariantPipeline of the label image
+        progress: Optional callback receiving a status message after each pass
+        configs: Indexes into OCR_CONFIGS to use, all of them by default
+        per_config: Optional dict that receives the settled values of each
+            config that read anything, keyed by config index; only configs
+            whose passes all finished are included, since an early stop
+            leaves the others with fewer readings than a run of their own
+        deadline: Optional time.monotonic() value at which to stop
+        errors: Optional list that receives the exception of every failed pass
+        
+    Returns:
+        tuple: (values, partial) where partial is True if the deadline cut
+            the passes short
+    """
+    if configs is None:
+        configs = range(len(OCR_CONFIGS))
+    scheduler = get_scheduler()
+    pairs = scheduler.order(
+        (variant, cfg_idx)
+        for variant in VARIANT_NAMES
+        for cfg_idx in configs
+    )
+    variants = pipeline.stream(variant for variant, _ in pairs)
+    jobs = (
+        (img, variant, cfg_idx)
+        for (variant, img), (_, cfg_idx) in zip(variants, pairs)
+    )
+    
+    readings = {}
+    config_readings = {}
+    config_passes = {}
+    stalled = 0
+    passes_done = 0
+    satisfied = False
+    
+    def on_result(job, result):
+        nonlocal stalled, passes_done, satisfied
+        _, variant, cfg_idx = job
+        text, values, elapsed_ms = result
+        
+        scheduler.record(variant, cfg_idx, len(values), elapsed_ms)
+        
+        new_value = False
+        for key, value in values.items():
+            new_value = new_value or value not in readings.get(key, [])
+            readings.setdefault(key, []).append(value)
+            config_readings.setdefault(cfg_idx, {}).setdefault(key, []).append(value)
+        config_passes[cfg_idx] = config_passes.get(cfg_idx, 0) + 1
+        stalled = 0 if new_value else stalled + 1
+        
+        passes_done += 1
+        if progress:
+            progress(f"OCR pass {passes_done} of up to {len(pairs)}: {len(readings)} nutrients found")
+            
+        # Debug log
+        if pipeline.debug:
+            get_debug_sink().log(f"Config {cfg_idx+1}, Image {variant}:\n{text}\n\nExtracted: {values}\n\n")
+            
+        satisfied = ocr_confidence(readings) >= OCR_CONFIDENCE_THRESHOLD or stalled >= OCR_STALL_PASSES
+        return satisfied
+    
+    def on_error(job, e):
+        _, variant, cfg_idx = job
+        print(f"OCR Error (Config {cfg_idx+1}, Image {variant}): {str(e)}")
+        if errors is not None:
+            errors.append(e)
+    
+    partial = False
+    if fan_out(_ocr_job, jobs, on_result, on_error, deadline=deadline):
+        if satisfied:
+            print("OCR confident enough, cancelled remaining passes")
+        else:
+            partial = True
+            print(f"OCR time budget used up after {passes_done} passes, returning partial result")
+    scheduler.maybe_save()
+    
+    if per_config is not None:
+        for cfg_idx, cfg_readings in config_readings.items():
+            if config_passes[cfg_idx] == len(VARIANT_NAMES):
+                per_config[cfg_idx] = settle_readings(cfg_readings)
+    return settle_readings(readings), partial
+
+def _is_value_word(text):
+    """Numbers (with or without a unit) count as values; percentages don't."""
+    return bool(re.match(r'[<~]?\d', text)) and '%' not in text
+
+def _center_x(word):
+    return word['left'] + word['width'] / 2
+
+def group_rows(words, line_height):
     """
-    all_results = {}
-    
-    for i, img in enumerate(processed_images):
-        for cfg_idx, cfg in enumerate(OCR_CONFIGS):
-            try:
-                config_str = '--oem 3 --psm 6 -c tessedit_char_whitelist="0123456789.,ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz() " --tessdata-dir "D:\\PyProject\\Eatfit\\Tesseract\\tessdata" -l eng'
-                text = pytesseract.image_to_string(img, config=config_str)
-                
-                # Clean OCR text
-                text = re.sub(r'\s+', ' ', text).strip()
-                
-                # Extract nutrition values
-                values = find_nutrition_values(text)
-                
-                # Merge with existing results
-                for key, value in values.items():
-                    if key not in all_results or (key in all_results and value > 0):
-                        all_results[key] = value
-                        
-                # Debug log
-                with open("ocr_debug.log", "a") as f:
-                    f.write(f"Config {cfg_idx+1}, Image {i+1}:\n{text}\n\nExtracted: {values}\n\n")
-                    
-            except Exception as e:
-                print(f"OCR Error (Config {cfg_idx+1}, Image {i+1}): {str(e)}")
-    
-    return all_results
-
-def extract_text(image_path):
+    Group OCR words into table rows by their vertical position.
+    
+    Args:
+        words: Word dicts from the backend's image_to_data
+        line_height: Typical word height, used as the row tolerance
+        
+    Returns:
+        list: Rows top to bottom, each a list of words left to right
+    """
+    rows = []
+    for word in sorted(words, key=lambda w: w['top'] + w['height'] / 2):
+        center_y = word['top'] + word['height'] / 2
+        if rows and abs(center_y - rows[-1]['center_y']) <= line_height / 2:
+            row = rows[-1]
+            row['words'].append(word)
+            row['center_y'] += (center_y - row['center_y']) / len(row['words'])
+        else:
+            rows.append({'center_y': center_y, 'words': [word]})
+    return [sorted(row['words'], key=lambda w: w['left']) for row in rows]
+
+def split_row(row):
+    """Split a row into its leading label words and the words after them."""
+    for i, word in enumerate(row):
+        if _is_value_word(word['text']):
+            return row[:i], row[i:]
+    return row, []
+
+def value_columns(nutrient_rows, line_height):
+    """
+    Find the value columns of the table.
+    
+    The x centres of the values on the nutrient rows are clustered: values of
+    one column sit close together, while neighbouring columns are separated
+    by a clear gap. Clusters with values from only a few rows (such as the
+    kcal figure of a "1891 kJ / 452 kcal" energy row) are not columns.
+    
+    Returns:
+        list: (left, right) extent of each column, left to right
+    """
+    values = sorted(
+        (
+            (word, row_idx)
+            for row_idx, (_, cells) in enumerate(nutrient_rows)
+            for word in cells if _is_value_word(word['text'])
+        ),
+        key=lambda value: _center_x(value[0])
+    )
+    columns = []
+    for word, row_idx in values:
+        if columns and _center_x(word) - columns[-1]['last'] <= line_height * 1.5:
+            column = columns[-1]
+        else:
+            column = {'left': word['left'], 'right': word['left'] + word['width'], 'rows': set()}
+            columns.append(column)
+        column['last'] = _center_x(word)
+        column['left'] = min(column['left'], word['left'])
+        column['right'] = max(column['right'], word['left'] + word['width'])
+        column['rows'].add(row_idx)
+    
+    min_rows = max(2, len(nutrient_rows) // 3)
+    return [(column['left'], column['right']) for column in columns if len(column['rows']) >= min_rows]
+
+def per_100g_column(rows, columns, line_height):
+    """
+    Pick the per-100g column: the one under a "100" header if there is one,
+    otherwise the first column (labels list per 100g before per serving).
+    """
+    for row in rows:
+        if find_label(' '.join(word['text'] for word in row)):
+            continue
+        for word in row:
+            if '100' in word['text']:
+                for i, (left, right) in enumerate(columns):
+                    if left - line_height <= _center_x(word) <= right + line_height:
+                        return i
+    return 0
+
+def rebuild_table_text(words):
+    """
+    Rebuild a nutrition table from OCR word boxes.
+    
+    Words are grouped into rows, the value columns are found from the
+    numbers on rows that name a nutrient, and each of those rows is reduced
+    to its label followed by the per-100g cell, e.g. "Total Fat 18.9 g".
+    
+    Args:
+        words: Word dicts from the backend's image_to_data
+        
+    Returns:
+        str: One line per nutrient row, or '' if no table could be rebuilt
+    """
+    words = [w for w in words if w['text'] and w['conf'] >= LAYOUT_MIN_WORD_CONF]
+    if not words:
+        return ''
+    heights = sorted(w['height'] for w in words)
+    line_height = max(heights[len(heights) // 2], 1)
+    
+    rows = group_rows(words, line_height)
+    nutrient_rows = []
+    for row in rows:
+        label_words, cells = split_row(row)
+        label = ' '.join(word['text'] for word in label_words)
+        if cells and find_label(label):
+            nutrient_rows.append((label, cells))
+    if len(nutrient_rows) < TABLE_MIN_ROWS:
+        return ''
+    
+    columns = value_columns(nutrient_rows, line_height)
+    if not columns:
+        return ''
+    column = per_100g_column(rows, columns, line_height)
+    cell_left = columns[column][0] - line_height
+    cell_right = columns[column + 1][0] - line_height if column + 1 < len(columns) else float('inf')
+    
+    lines = []
+    for label, cells in nutrient_rows:
+        cell = [word['text'] for word in cells if cell_left <= word['left'] < cell_right]
+        if cell and _is_value_word(cell[0]):
+            lines.append(f"{label} {' '.join(cell)}")
+    return '\n'.join(lines)
+
+def layout_ocr(pipeline, progress=None):
+    """
+    Read the label with a single OCR pass using word positions.
+    
+    Runs tesseract once in data mode, rebuilds the table rows and columns
+    from the word boxes and reads each nutrient from the per-100g column.
+    
+    Args:
+        pipeline: VariantPipeline of the label image
+        progress: Optional callback receiving a status message
+        
+    Returns:
+        dict: Nutrition values, or None when the table layout could not be
+            rebuilt well enough and the multi-variant passes should run
+    """
+    if progress:
+        progress("Reading the nutrition table layout")
+    start = time.perf_counter()
+    try:
+        words = get_backend().image_to_data(pipeline.get(LAYOUT_VARIANT), LAYOUT_CONFIG)
+    except Exception as e:
+        print(f"Layout OCR Error: {str(e)}")
+        return None
+    
+    text = rebuild_table_text(words)
+    values = find_nutrition_values(text) if text else {}
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    if pipeline.debug:
+        get_debug_sink().log(f"Layout pass ({len(words)} words, {elapsed_ms:.0f} ms):\n{text}\n\nExtracted: {values}\n\n")
+    
+    if len(values) < LAYOUT_MIN_NUTRIENTS:
+        print(f"Table layout gave {len(values)} nutrients, falling back to image variants")
+        return None
+    print(f"Table layout gave {len(values)} nutrients in {elapsed_ms:.0f} ms")
+    return values
+
+def pipeline_id():
+    """
+    Identify the current preprocessing/OCR configuration.
+    Cached OCR results are only reused when this identifier matches.
+    """
+    signature = json.dumps([OCR_PIPELINE_VERSION, VARIANT_NAMES, OCR_CONFIGS, LAYOUT_CONFIG], sort_keys=True)
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()[:12]
+
+def config_result_id(cfg_idx):
+    """Cache identifier for the results of a single OCR config."""
+    return f"{pipeline_id()}/cfg{cfg_idx}"
+
+def extract_text(image_path, progress=None, use_cache=True, config_idx=None, data=None, budget=None,
+                 raise_errors=False, image=None):
     """
     Extract text from an image and process it to find nutrition information.
+    Results are cached by image content, so identical images are only processed once.
+    
+    The default run tries the layout pass and then every config. The values
+    of each config whose passes all ran are cached as well, so asking for
+    one config later (config_idx) is served from the cache when possible and
+    otherwise only runs that config's passes.
+    
+    Args:
+        image_path: Path of the uploaded label image
+        progress: Optional callback receiving status messages while OCR runs
+        use_cache: Set to False to always run OCR (e.g. when benchmarking)
+        config_idx: Index into OCR_CONFIGS to read the label with that config only
+        data: The image bytes, if they are already in memory (e.g. a fresh
+            upload that is still being written to image_path)
+        budget: Optional time limit in seconds. When it runs out, the values
+            found so far are returned with 'ocr_partial' set to True (partial
+            and empty results are not cached)
+        raise_errors: Raise errors instead of returning {}, including when
+            every OCR pass failed (e.g. for batch runs that report failures)
+        image: The image decoded by load_image, if that was done already
+            (e.g. to look for a barcode)
+            
+    Returns:
+        dict: The nutrition values found; {'quality_error': message} if the
+            quality gate rejected the photo, {} on errors
     """
+    deadline = time.monotonic() + budget if budget else None
     try:
-        img = cv2.imread(image_path)
+        if data is None:
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f"Image not found at {image_path}")
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        
+        cache = get_ocr_cache()
+        image_hash = content_hash(data)
+        result_id = pipeline_id() if config_idx is None else config_result_id(config_idx)
+        cached = cache.get(image_hash, result_id) if use_cache else None
+        if cached is not None:
+            print(f"Using cached nutrition data: {cached}")
+            return dict(cached)
+        
+        img = image if image is not None else decode_image(data)
         if img is None:
-            raise FileNotFoundError(f"Image not found at {image_path}")
+            raise ValueError(f"Could not decode image at {image_path}")
+        
+        # Photos no OCR pass could read are turned away before any of them runs
+        img, rejection = check_image(img)
+        if rejection:
+            nutrition_data = {'quality_error': rejection}
+            if use_cache:
+                cache.put(image_hash, result_id, nutrition_data)
+            return dict(nutrition_data)
             
-        processed_images = enhance_image(img)
-        nutrition_data = enhanced_ocr(processed_images)
+        img = crop_to_nutrition_table(img)
+        pipeline = VariantPipeline(img, debug=get_debug_sink().sample())
+        per_config = {}
+        partial = False
+        errors = []
+        
+        if config_idx is not None:
+            nutrition_data, partial = enhanced_ocr(pipeline, progress, configs=[config_idx], deadline=deadline,
+                                                   errors=errors)
+        else:
+            # One layout-aware pass first; the variant passes only run when it falls short
+            nutrition_data = layout_ocr(pipeline, progress)
+            if nutrition_data is None:
+                nutrition_data, partial = enhanced_ocr(pipeline, progress, per_config=per_config, deadline=deadline,
+                                                       errors=errors)
+        
+        if not nutrition_data and errors and raise_errors:
+            raise RuntimeError(f"Every OCR pass failed: {str(errors[0])}") from errors[0]
+        
+        if partial:
+            print(f"Partial nutrition data: {nutrition_data}")
+            return dict(nutrition_data, ocr_partial=True)
+        
+        # An empty result is what every pass failing looks like (e.g. a broken
+        # tesseract install), so it must not stick to the photo
+        if use_cache and nutrition_data:
+            cache.put(image_hash, result_id, nutrition_data)
+            for cfg_idx, values in per_config.items():
+                cache.put(image_hash, config_result_id(cfg_idx), values)
         
         print(f"Extracted nutrition data: {nutrition_data}")
-        return nutrition_data
+        return dict(nutrition_data)
         
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Extract Text Error: {str(e)}")
-        return {} 
\ No newline at end of file
+        return {}
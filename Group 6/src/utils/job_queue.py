@@ -0,0 +1,141 @@
+"""
+In-process background job queue.
+
+Long-running work (such as OCR on an uploaded label) is submitted here
+instead of running inside the request. The request gets a job id back
+straight away and the client polls the job's status, or follows its
+progress events, until the result is ready. Jobs run on a bounded thread
+pool; no external broker is needed.
+"""
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs running at the same time, and jobs allowed to wait for a slot
+JOB_WORKERS = 2
+MAX_PENDING_JOBS = 50
+
+# How long finished jobs are kept around for their result to be collected
+JOB_TTL_SECONDS = 60 * 60
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting."""
+
+
+class Job:
+    """State of one background job."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []  # [(seq, message)]
+        self._changed = threading.Condition()
+
+    def progress(self, message):
+        """Record a progress event and wake anyone following the job."""
+        with self._changed:
+            self.events.append((len(self.events) + 1, message))
+            self._changed.notify_all()
+
+    def _set_status(self, status, result=None, error=None):
+        with self._changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            if status in ('done', 'failed'):
+                self.finished = time.time()
+            self._changed.notify_all()
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def wait_for_change(self, last_seq, timeout):
+        """
+        Wait until there are events after last_seq or the job finishes.
+
+        Returns:
+            list: New (seq, message) events (may be empty on timeout)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > last_seq or self.is_finished, timeout)
+            return self.events[last_seq:]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': self.events[-1][1] if self.events else None,
+            'error': self.error,
+        }
+
+
+class JobQueue:
+    """Bounded pool of background worker threads with job bookkeeping."""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, progress=job.progress, **kwargs) to run in the background.
+
+        Returns:
+            str: The new job's id
+
+        Raises:
+            QueueFullError: If max_pending jobs are already waiting or running
+        """
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if not job.is_finished)
+            if active >= self.max_pending:
+                raise QueueFullError("Too many uploads are being processed, please try again shortly")
+            job = Job(uuid.uuid4().hex)
+            self._jobs[job.id] = job
+
+        job.progress('Queued')
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job.id
+
+    def get(self, job_id):
+        """Get a job by id, or None if it is unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job._set_status('running')
+        try:
+            result = func(*args, progress=job.progress, **kwargs)
+        except Exception as e:
+            print(f"Background job {job.id} failed: {str(e)}")
+            job._set_status('failed', error=str(e))
+            return
+        job._set_status('done', result=result)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Get the process-wide job queue."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,148 @@
+"""
+Single-pass nutrient extraction from OCR text.
+
+All nutrient labels and numbers are matched by one precompiled pattern, so the text is
+scanned once no matter how many nutrients are looked for. Each label is
+paired with the first number that follows it, which gives
+(nutrient, value, unit) readings in text order. find_nutrition_values and
+parse_nutrition both build their results from these readings, and stop
+reading once every nutrient has one.
+"""
+import re
+
+# Label spellings per nutrient. A space matches any amount of whitespace,
+# including none, since OCR often drops or adds spaces.
+NUTRIENT_LABELS = {
+    'energy_kcal': ['energy value', 'energy', 'calories', 'kcal'],
+    'saturated_fat': ['saturated fat', 'saturates', 'sat. fat'],
+    'fat': ['total fat', 'fat content', 'fat'],
+    'carbohydrates': ['total carbohydrates', 'total carbohydrate', 'carbohydrates',
+                      'carbohydrate', 'carbs', 'carb'],
+    'sugars': ['of which sugars', 'of which sugar', 'total sugars', 'total sugar',
+               'sugars', 'sugar'],
+    'fiber': ['dietary fibre', 'dietary fiber', 'fibre', 'fiber'],
+    'protein': ['proteins', 'protein'],
+    'salt': ['salt'],
+    'sodium': ['sodium'],
+}
+
+# Units a reading must carry to be accepted (None in a set means no unit was
+# printed; None instead of a set accepts any unit). Energy in kJ only is
+# skipped in favour of a later kcal figure.
+ACCEPTED_UNITS = {
+    'energy_kcal': {None, 'kcal'},
+    'salt': {'g', 'mg'},
+    'sodium': {'g', 'mg'},
+}
+DEFAULT_UNITS = {'g'}
+
+# Spelling with whitespace removed -> nutrient
+_LABEL_LOOKUP = {
+    spelling.replace(' ', ''): nutrient
+    for nutrient, spellings in NUTRIENT_LABELS.items()
+    for spelling in spellings
+}
+
+# The labels are one plain alternation (no named groups) so the regex engine
+# can skip quickly to positions where a label may start. A label takes the
+# first number after it, like the per-nutrient "label[^\d]*number unit"
+# patterns this replaces, but the gap stops at the next label, so in
+# "fat, of which saturates 5 g" the 5 goes to saturates only. The gap is
+# read a word at a time and only the start of each word is checked against
+# the labels; a word that merely contains one ("fatty") doesn't stop it. A
+# unit in brackets in the gap ("Energy (kJ) 1891") is the unit of the row.
+# Energy printed as "1891 kJ / 452 kcal" also captures the kcal figure.
+_LABEL_ALTERNATION = '|'.join(
+    re.escape(spelling).replace(r'\ ', r'\s*')
+    for spelling in sorted(
+        (spelling for spellings in NUTRIENT_LABELS.values() for spelling in spellings),
+        key=len, reverse=True)
+)
+_LABEL_PATTERN = re.compile(_LABEL_ALTERNATION)
+_NUMBER = r'(\d+[.,]?\d*)'
+_GAP = r'(?:[^\da-z]|(?<![a-z])(?!(?:' + _LABEL_ALTERNATION + r')(?![a-z]))[a-z]+(?![a-z]))*'
+_TOKEN_PATTERN = re.compile(
+    r'(' + _LABEL_ALTERNATION + r')[a-z]*(' + _GAP + r')'
+    + _NUMBER + r'\s*(kcal|kj|mg|g)?'
+    r'(?:[\s/|]*' + _NUMBER + r'\s*kcal)?'
+)
+_GAP_UNIT_PATTERN = re.compile(r'\(\s*(kcal|kj|mg|g)\s*\)')
+
+
+def iter_readings(text):
+    """
+    Read nutrient labels with the number after each, lazily, in text order.
+
+    Like scan(), but stops reading the text as soon as the caller stops
+    asking for readings.
+
+    Args:
+        text: OCR text (matching is case-insensitive)
+
+    Yields:
+        tuple: (nutrient, value, unit); unit is None when none was printed
+    """
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        label, gap, number, unit, kcal_number = match.groups()
+        if not unit and '(' in gap:
+            gap_unit = _GAP_UNIT_PATTERN.search(gap)
+            unit = gap_unit.group(1) if gap_unit else None
+        if unit == 'kj' and kcal_number:
+            number, unit = kcal_number, 'kcal'
+        yield _LABEL_LOOKUP[''.join(label.split())], float(number.replace(',', '.')), unit or None
+
+
+def scan(text):
+    """
+    Scan OCR text once and read every nutrient label with the number after it.
+
+    Args:
+        text: OCR text (matching is case-insensitive)
+
+    Returns:
+        list: (nutrient, value, unit) tuples in text order; unit is None
+            when none was printed
+    """
+    return list(iter_readings(text))
+
+
+def find_label(text):
+    """
+    Find the first nutrient label in a piece of text.
+
+    Returns:
+        str: The nutrient the label names, or None if there is none
+    """
+    match = _LABEL_PATTERN.search(text.lower())
+    return _LABEL_LOOKUP[''.join(match.group(0).split())] if match else None
+
+
+def first_readings(readings, accepted_units=None):
+    """
+    Keep the first acceptable reading of each nutrient.
+
+    A reading is acceptable when its unit fits the nutrient; otherwise the
+    next occurrence of the label is tried.
+
+    Args:
+        readings: Readings from scan() or iter_readings(); an iterator is
+            only read until every nutrient has a reading
+        accepted_units: Per-nutrient unit rules, defaults to ACCEPTED_UNITS
+            (nutrients not listed need DEFAULT_UNITS)
+
+    Returns:
+        dict: nutrient -> (value, unit), in the order the nutrients appear
+    """
+    if accepted_units is None:
+        accepted_units = ACCEPTED_UNITS
+
+    found = {}
+    for nutrient, value, unit in readings:
+        if nutrient in found:
+            continue
+        units = accepted_units.get(nutrient, DEFAULT_UNITS)
+        if units is None or unit in units:
+            found[nutrient] = (value, unit)
+            if len(found) == len(NUTRIENT_LABELS):
+                break
+    return found
@@ -1,35 +1,123 @@
 """
 Nutrition data parsing and scoring utilities.
 """
-import re
-import requests
 import json
 from utils.image_processing import extract_text
+from utils.nutrient_extractor import iter_readings, first_readings, ACCEPTED_UNITS
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from models.food_analysis import get_product_from_off
+from utils.off_client import get_off_client, OFFUnavailable, PRODUCT_FIELDS
+from utils.alternatives_index import get_alternatives_index
 
 logger = logging.getLogger(__name__)
 
+# Alternatives shown per product, and the most threads one request uses
+# for its category searches
+ALTERNATIVES_LIMIT = 6
+ALTERNATIVE_SEARCH_WORKERS = 4
+
+# Nutrition values per 100 g, as read from labels and the API
+NUTRIENT_KEYS = ('energy_kcal', 'fat', 'saturated_fat', 'carbohydrates', 'sugars', 'fiber', 'protein', 'salt')
+
+def _search_category(client, category, target_grades):
+    """Search OFF for products of one category with one of the target grades."""
+    params = {
+        'action': 'process',
+        'tagtype_0': 'categories',
+        'tag_contains_0': 'contains',
+        'tag_0': category,
+        'tagtype_1': 'nutrition_grades',
+        'tag_contains_1': 'contains',
+        'tag_1': target_grades,
+        'sort_by': 'unique_scans_n',
+        'page_size': 10
+    }
+    return client.search(params)
+
+def _compare_alternative(alt_product, barcode, current_grade, current_product, target_grades):
+    """
+    Describe how a search result improves on the current product.
+    
+    Returns:
+        dict: The alternative as the template shows it, or None if it is the
+            same product, lacks key data or is no better
+    """
+    # Skip if it's the same product or missing key data
+    if (alt_product.get('code') == barcode or
+        not alt_product.get('product_name') or
+        not alt_product.get('image_url') or
+        not alt_product.get('nutriments')):
+        return None
+    
+    # Calculate improvements over current product
+    improvements = []
+    
+    # Compare Nutri-Score
+    alt_score = alt_product.get('nutrition_grades', '').lower()
+    if alt_score in target_grades and (not current_grade or alt_score < current_grade.lower()):
+        improvements.append(f"Better Nutri-Score ({alt_score.upper()})")
+    
+    # Compare NOVA score
+    alt_nova = alt_product.get('nova_group')
+    current_nova = current_product['nova_group']
+    if alt_nova and current_nova and alt_nova < current_nova:
+        improvements.append("Less processed")
+    
+    # Compare key nutrients
+    alt_nutrients = alt_product.get('nutriments', {})
+    current_nutrients = current_product['nutrients']
+    
+    nutrient_comparisons = [
+        ('sugars_100g', 'sugar', '<'),
+        ('salt_100g', 'salt', '<'),
+        ('fiber_100g', 'fiber', '>'),
+        ('proteins_100g', 'protein', '>')
+    ]
+    
+    for nutrient_key, nutrient_name, comparison in nutrient_comparisons:
+        alt_value = alt_nutrients.get(nutrient_key, 0)
+        current_value = current_nutrients.get(nutrient_key, 0)
+        
+        if current_value > 0:  # Only compare if current product has this nutrient
+            if comparison == '<' and alt_value < current_value:
+                improvements.append(f"Lower in {nutrient_name}")
+            elif comparison == '>' and alt_value > current_value:
+                improvements.append(f"Higher in {nutrient_name}")
+    
+    # Only add product if we found improvements
+    if not improvements:
+        return None
+    return {
+        'product_name': alt_product['product_name'],
+        'brand': alt_product.get('brands', 'Unknown Brand'),
+        'image_url': alt_product['image_url'],
+        'nutriscore_grade': alt_score.upper(),
+        'nova_group': alt_nova,
+        'reason': " • ".join(improvements[:3]),  # Top 3 improvements
+        'is_indian': False
+    }
+
 def get_alternatives_by_category(barcode, current_grade):
     """
-    Get alternative products with better nutri-scores from the same category
+    Get alternative products with better nutri-scores from the same category.
+    
+    Alternatives come from the precomputed alternatives index first. When
+    it has fewer than ALTERNATIVES_LIMIT for the product's categories, the
+    categories are searched on OFF concurrently to top them up, with
+    results used in the order they arrive; once the limit is reached the
+    searches still pending are cancelled, so the wait is at most the
+    slowest single search. Each request searches on threads of its own,
+    so it never waits behind the searches of other requests.
     """
     try:
         # First, get the product details to find its category
-        url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
-        response = requests.get(url, timeout=10)
+        client = get_off_client()
+        product = client.get_product(barcode, PRODUCT_FIELDS['alternatives'])
         
-        if response.status_code != 200:
+        if not product:
             logger.warning(f"Failed to get product details for barcode {barcode}")
             return []
-            
-        data = response.json()
-        
-        if data.get('status') != 1 or 'product' not in data:
-            logger.warning(f"Invalid product data received for barcode {barcode}")
-            return []
-            
-        product = data['product']
         
         # Get categories to search
         categories = []
@@ -55,170 +143,91 @@ def get_alternatives_by_category(barcode, current_grade):
         alternatives = []
         target_grades = ['a', 'b']  # Look for A and B rated products
         
-        for category in categories:
-            try:
-                # Search for alternatives
-                search_url = "https://world.openfoodfacts.org/cgi/search.pl"
-                params = {
-                    'action': 'process',
-                    'tagtype_0': 'categories',
-                    'tag_contains_0': 'contains',
-                    'tag_0': category,
-                    'tagtype_1': 'nutrition_grades',
-                    'tag_contains_1': 'contains',
-                    'tag_1': target_grades,
-                    'sort_by': 'unique_scans_n',
-                    'page_size': 10,
-                    'json': 1
-                }
-                
-                search_response = requests.get(search_url, params=params, timeout=15)
-                
-                if search_response.status_code != 200:
+        for alt_product in get_alternatives_index().lookup(categories):
+            alternative = _compare_alternative(alt_product, barcode, current_grade,
+                                               current_product, target_grades)
+            if alternative and not any(a['product_name'] == alternative['product_name'] for a in alternatives):
+                alternatives.append(alternative)
+            if len(alternatives) >= ALTERNATIVES_LIMIT:
+                break
+        if len(alternatives) >= ALTERNATIVES_LIMIT:
+            return alternatives
+        
+        # Too few indexed (e.g. an index built only from earlier lookups), so top up from OFF
+        search_executor = ThreadPoolExecutor(max_workers=min(len(categories), ALTERNATIVE_SEARCH_WORKERS),
+                                             thread_name_prefix='off-search')
+        searches = {
+            search_executor.submit(_search_category, client, category, target_grades): category
+            for category in categories
+        }
+        try:
+            for future in as_completed(searches):
+                category = searches[future]
+                try:
+                    results = future.result()
+                except OFFUnavailable as e:
+                    # The other categories would fail the same way
+                    logger.error(f"Error searching category {category}: {str(e)}")
+                    break
+                except Exception as e:
+                    logger.error(f"Error searching category {category}: {str(e)}")
                     continue
-                    
-                search_data = search_response.json()
                 
-                for alt_product in search_data.get('products', []):
-                    # Skip if it's the same product or missing key data
-                    if (alt_product.get('code') == barcode or
-                        not alt_product.get('product_name') or
-                        not alt_product.get('image_url') or
-                        not alt_product.get('nutriments')):
-                        continue
-                    
-                    # Calculate improvements over current product
-                    improvements = []
-                    
-                    # Compare Nutri-Score
-                    alt_score = alt_product.get('nutrition_grades', '').lower()
-                    if alt_score in target_grades and (not current_grade or alt_score < current_grade.lower()):
-                        improvements.append(f"Better Nutri-Score ({alt_score.upper()})")
-                    
-                    # Compare NOVA score
-                    alt_nova = alt_product.get('nova_group')
-                    current_nova = current_product['nova_group']
-                    if alt_nova and current_nova and alt_nova < current_nova:
-                        improvements.append("Less processed")
-                    
-                    # Compare key nutrients
-                    alt_nutrients = alt_product.get('nutriments', {})
-                    current_nutrients = current_product['nutrients']
-                    
-                    nutrient_comparisons = [
-                        ('sugars_100g', 'sugar', '<'),
-                        ('salt_100g', 'salt', '<'),
-                        ('fiber_100g', 'fiber', '>'),
-                        ('proteins_100g', 'protein', '>')
-                    ]
-                    
-                    for nutrient_key, nutrient_name, comparison in nutrient_comparisons:
-                        alt_value = alt_nutrients.get(nutrient_key, 0)
-                        current_value = current_nutrients.get(nutrient_key, 0)
-                        
-                        if current_value > 0:  # Only compare if current product has this nutrient
-                            if comparison == '<' and alt_value < current_value:
-                                improvements.append(f"Lower in {nutrient_name}")
-                            elif comparison == '>' and alt_value > current_value:
-                                improvements.append(f"Higher in {nutrient_name}")
-                    
-                    # Only add product if we found improvements
-                    if improvements:
-                        alternative = {
-                            'product_name': alt_product['product_name'],
-                            'brand': alt_product.get('brands', 'Unknown Brand'),
-                            'image_url': alt_product['image_url'],
-                            'nutriscore_grade': alt_score.upper(),
-                            'nova_group': alt_nova,
-                            'reason': " • ".join(improvements[:3]),  # Top 3 improvements
-                            'is_indian': False
-                        }
-                        
-                        # Add to alternatives if not already present
-                        if not any(a['product_name'] == alternative['product_name'] for a in alternatives):
-                            alternatives.append(alternative)
-                    
-                    # Limit to top 6 alternatives
-                    if len(alternatives) >= 6:
+                for alt_product in results:
+                    alternative = _compare_alternative(alt_product, barcode, current_grade,
+                                                       current_product, target_grades)
+                    # Add to alternatives if not already present
+                    if alternative and not any(a['product_name'] == alternative['product_name'] for a in alternatives):
+                        alternatives.append(alternative)
+                    if len(alternatives) >= ALTERNATIVES_LIMIT:
                         break
                 
-                if len(alternatives) >= 6:
+                if len(alternatives) >= ALTERNATIVES_LIMIT:
                     break
-                    
-            except Exception as e:
-                logger.error(f"Error searching category {category}: {str(e)}")
-                continue
+        finally:
+            # Searches already sent finish in the background and are dropped
+            search_executor.shutdown(wait=False, cancel_futures=True)
         
-        return alternatives[:6]  # Return top 6 alternatives
+        return alternatives[:ALTERNATIVES_LIMIT]
             
     except Exception as e:
         logger.error(f"Error finding alternatives: {str(e)}")
         return []
 
+# Unit rules for parse_nutrition: sodium only counts in mg and salt in g,
+# the other nutrients are taken whatever unit follows them
+PARSE_UNITS = {
+    **ACCEPTED_UNITS,
+    'fat': None,
+    'saturated_fat': None,
+    'carbohydrates': None,
+    'fiber': None,
+    'protein': None,
+    'salt': {'g'},
+    'sodium': {'mg'},
+}
+
 def parse_nutrition(text):
     """
     Parse nutrition information from text.
     """
-    # Energy patterns with parentheses support
-    energy_matches = re.findall(
-        r'(?:Energy\s*\(?kcal\)?.*?)(\d+\.?\d*)|'
-        r'(\d+\.?\d*)\s*\(?kcal\)?(?=\s|$)',
-        text,
-        re.IGNORECASE
-    )
-    
-    energy_values = [float(m[0] or m[1]) for m in energy_matches if any(m)]
-    
+    found = {nutrient: value for nutrient, (value, _) in first_readings(iter_readings(text), PARSE_UNITS).items()}
+
     nutrition = {
-        'energy_kcal': energy_values[0] if energy_values else None,
-        'sugars': None,
+        'energy_kcal': found.get('energy_kcal'),
+        'sugars': found.get('sugars'),
         'salt': None
     }
 
-    sugar_patterns = [
-        r'(of\s*which\s*sugars.*?)(\d+\.?\d*)\s*g',
-        r'\bsugars?\b.*?(\d+\.?\d*)\s*g'
-    ]
-    for pattern in sugar_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            try:
-                nutrition['sugars'] = float(match.group(1))
-                break
-            except:
-                continue
+    if 'sodium' in found:
+        nutrition['salt'] = found['sodium'] / 400  # Convert to grams
+    if 'salt' in found and not nutrition['salt']:
+        nutrition['salt'] = found['salt']
 
-    sodium_match = re.search(r'sodium.*?(\d+\.?\d*)\s*mg', text, re.IGNORECASE)
-    if sodium_match:
-        try:
-            sodium_mg = float(sodium_match.group(1))
-            nutrition['salt'] = sodium_mg / 400  # Convert to grams
-        except:
-            pass
-    
-    salt_match = re.search(r'salt.*?(\d+\.?\d*)\s*g', text, re.IGNORECASE)
-    if salt_match and not nutrition['salt']:
-        try:
-            nutrition['salt'] = float(salt_match.group(1))
-        except:
-            pass
+    for nutrient in ('fat', 'saturated_fat', 'carbohydrates', 'fiber', 'protein'):
+        if nutrient in found:
+            nutrition[nutrient] = found[nutrient]
 
-    nutrient_patterns = {
-        'fat': r'(Total Fat|Fat)[^\d]*(\d+\.?\d*)',
-        'saturated_fat': r'(Saturates|Saturated Fat)[^\d]*(\d+\.?\d*)',
-        'carbohydrates': r'(Carbohydrates|Carbs)[^\d]*(\d+\.?\d*)',
-        'fiber': r'(Fibre|Fiber)[^\d]*(\d+\.?\d*)',
-        'protein': r'Protein[^\d]*(\d+\.?\d*)'
-    }
-    
-    for nutrient, pattern in nutrient_patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            try:
-                nutrition[nutrient] = float(match.group(2))
-            except:
-                continue
-    
     return nutrition
 
 def merge_nutrition_data(ocr_data, api_data):
@@ -235,7 +244,7 @@ def merge_nutrition_data(ocr_data, api_data):
             continue
             
         # For nutrition values, handle numeric comparison
-        if key in ['energy_kcal', 'fat', 'saturated_fat', 'carbohydrates', 'sugars', 'fiber', 'protein', 'salt']:
+        if key in NUTRIENT_KEYS:
             # Convert to float for comparison
             try:
                 api_value = float(api_value) if api_value is not None else 0
@@ -259,10 +268,20 @@ def merge_nutrition_data(ocr_data, api_data):
     
     return merged
 
-def process_with_config(image_path, config_idx, barcode=None):
+def process_with_config(image_path, config_idx, barcode=None, progress=None, image_data=None, budget=None,
+                        image=None):
     """
     Process image with a specific OCR configuration and extract nutrition data.
     Optionally use barcode to fetch data from Open Food Facts API.
+    An optional progress callback receives status messages while OCR runs.
+    
+    Config 0 is the full OCR pipeline; config n (1 to len(OCR_CONFIGS)) reads
+    the label with OCR_CONFIGS[n - 1] only. Results are cached per image and
+    config, so going back to a config that was already tried costs no OCR.
+    image_data can hold the image bytes when they are already in memory, and
+    image the decoded image (see load_image) when it was decoded already.
+    With a budget (seconds), OCR stops when it runs out and the values read
+    so far come back with 'ocr_partial' set.
     """
     nutrition_data = {}
     api_data = {}
@@ -272,7 +291,7 @@ def process_with_config(image_path, config_idx, barcode=None):
         # Try to get data from API if barcode is provided
         if barcode:
             # Get product data from the OpenFoodFacts API
-            product = get_product_from_off(barcode)
+            product = get_product_from_off(barcode, PRODUCT_FIELDS['process_with_config'])
             
             # Process the product data if found
             if product:
@@ -319,7 +338,19 @@ def process_with_config(image_path, config_idx, barcode=None):
                 api_data = {'error': 'Product not found in database'}
         
         # Extract data from image using OCR
-        ocr_data = extract_text(image_path)
+        ocr_data = extract_text(image_path, progress, config_idx=config_idx - 1 if config_idx else None,
+                                data=image_data, budget=budget, image=image)
+        
+        # A photo the quality gate rejected can't be read by any configuration
+        quality_error = ocr_data.pop('quality_error', None)
+        if quality_error and not (barcode and 'error' not in api_data):
+            return {"error": quality_error}
+        
+        # OCR that ran out of time before reading anything comes back as just
+        # the flag, which must not count as label data
+        ocr_partial = ocr_data.pop('ocr_partial', False)
+        if not any(key in ocr_data for key in NUTRIENT_KEYS):
+            ocr_data = {}
         
         # If we have both OCR and API data, merge them
         if ocr_data and 'error' not in api_data and barcode:
@@ -347,6 +378,8 @@ def process_with_config(image_path, config_idx, barcode=None):
             if barcode and 'error' in api_data:
                 nutrition_data['api_error'] = api_data['error']
         
+        if ocr_partial:
+            nutrition_data['ocr_partial'] = True
         return nutrition_data
     except Exception as e:
         print(f"Error in process_with_config: {str(e)}")
@@ -0,0 +1,258 @@
+"""
+OCR backends used by the image processing pipeline.
+
+The preferred backend keeps warm tesseract engines in memory through
+tesserocr (the tesseract C++ API): each OCR worker loads the traineddata
+once per configuration and reuses the engine for every later request, and
+images are handed over as raw pixel buffers. When tesserocr is not
+installed, or an engine cannot be initialised, the pytesseract backend is
+used instead, which starts a tesseract process per call.
+
+Every backend offers image_to_string (plain text) and image_to_data (one
+dict per recognised word with its bounding box and confidence).
+"""
+import os
+import re
+import shlex
+import threading
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Force a backend ('tesserocr' or 'pytesseract'); picks the best available one by default
+OCR_BACKEND = os.environ.get('EATFIT_OCR_BACKEND', '')
+
+# Directory with the tesseract traineddata files; tesseract's own default
+# (TESSDATA_PREFIX or its install directory) is used when unset or missing
+TESSDATA_DIR = os.environ.get('TESSDATA_DIR', '')
+
+
+def tessdata_dir(path=None):
+    """
+    Get the tessdata directory to pass to tesseract.
+
+    Args:
+        path: Directory named by an OCR config, if any; TESSDATA_DIR otherwise
+
+    Returns:
+        str: The directory, or None if it doesn't exist on this machine
+    """
+    path = path or TESSDATA_DIR
+    return path if path and os.path.isdir(path) else None
+
+
+def build_config_string(cfg):
+    """
+    Build the tesseract command line options for an OCR config.
+
+    --tessdata-dir is added only when the directory exists, and dropped from
+    the config's options when the one named there doesn't.
+
+    Args:
+        cfg: Dict with 'oem', 'psm' and 'extra' keys (see OCR_CONFIGS)
+
+    Returns:
+        str: Options string as understood by pytesseract
+    """
+    extra = cfg.get('extra', '')
+    named = parse_extra_options(extra)['path']
+    if named:
+        extra = re.sub(r'\s*--tessdata-dir\s+(?:"[^"]*"|\S+)', '', extra)
+    options = f"--oem {cfg['oem']} --psm {cfg['psm']}"
+    path = tessdata_dir(named)
+    if path:
+        options += f' --tessdata-dir "{path}"'
+    return f"{options} {extra.strip()}".strip()
+
+
+def parse_extra_options(extra):
+    """
+    Split the 'extra' tesseract options of an OCR config into engine settings.
+
+    Args:
+        extra: Options string such as '-c key=value --tessdata-dir "path" -l eng'
+
+    Returns:
+        dict: 'path', 'lang', 'dpi' and 'variables' entries
+    """
+    options = {'path': None, 'lang': 'eng', 'dpi': None, 'variables': {}}
+    tokens = shlex.split(extra or '', posix=True)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token == '-c' and value and '=' in value:
+            key, _, var_value = value.partition('=')
+            options['variables'][key] = var_value
+            i += 2
+        elif token == '--tessdata-dir' and value:
+            options['path'] = value
+            i += 2
+        elif token == '-l' and value:
+            options['lang'] = value
+            i += 2
+        elif token == '--dpi' and value:
+            options['dpi'] = int(value)
+            i += 2
+        else:
+            i += 1
+    return options
+
+
+def make_word(text, left, top, width, height, conf):
+    """One recognised word, in the format returned by image_to_data."""
+    return {
+        'text': text.strip(),
+        'left': int(left),
+        'top': int(top),
+        'width': int(width),
+        'height': int(height),
+        'conf': float(conf),
+    }
+
+
+class PytesseractBackend:
+    """Runs a tesseract subprocess for every call."""
+
+    name = 'pytesseract'
+
+    def image_to_string(self, img, cfg):
+        return pytesseract.image_to_string(img, config=build_config_string(cfg))
+
+    def image_to_data(self, img, cfg):
+        data = pytesseract.image_to_data(img, config=build_config_string(cfg),
+                                         output_type=pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data['text']):
+            if text and text.strip():
+                words.append(make_word(text, data['left'][i], data['top'][i],
+                                       data['width'][i], data['height'][i], data['conf'][i]))
+        return words
+
+
+class TesserocrBackend:
+    """Keeps one warm tesseract engine per OCR config in each thread."""
+
+    name = 'tesserocr'
+
+    def __init__(self):
+        # Tesseract engines are not thread-safe, so each thread gets its own set
+        self._local = threading.local()
+
+    def _engine(self, cfg):
+        engines = getattr(self._local, 'engines', None)
+        if engines is None:
+            engines = self._local.engines = {}
+
+        key = (cfg['oem'], cfg['psm'], cfg.get('extra', ''))
+        if key not in engines:
+            options = parse_extra_options(cfg.get('extra', ''))
+            kwargs = {'lang': options['lang'], 'oem': cfg['oem'], 'psm': cfg['psm']}
+            path = tessdata_dir(options['path'])
+            if path:
+                kwargs['path'] = path
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            for name, value in options['variables'].items():
+                api.SetVariable(name, value)
+            engines[key] = (api, options['dpi'])
+        return engines[key]
+
+    def _set_image(self, img, cfg):
+        api, dpi = self._engine(cfg)
+
+        # Hand the pixel buffer to tesseract directly, no temp files
+        if img.ndim == 3:
+            img = img[:, :, ::-1]  # BGR -> RGB
+        img = np.ascontiguousarray(img)
+        height, width = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        api.SetImageBytes(img.tobytes(), width, height, bytes_per_pixel, img.strides[0])
+        if dpi:
+            api.SetSourceResolution(dpi)
+        return api
+
+    def image_to_string(self, img, cfg):
+        api = self._set_image(img, cfg)
+        text = api.GetUTF8Text()
+        api.Clear()
+        return text
+
+    def image_to_data(self, img, cfg):
+        api = self._set_image(img, cfg)
+        words = []
+        try:
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is not None:
+                level = tesserocr.RIL.WORD
+                for word in tesserocr.iterate_level(iterator, level):
+                    text = word.GetUTF8Text(level)
+                    if not text or not text.strip():
+                        continue
+                    x1, y1, x2, y2 = word.BoundingBox(level)
+                    words.append(make_word(text, x1, y1, x2 - x1, y2 - y1, word.Confidence(level)))
+        finally:
+            api.Clear()
+        return words
+
+
+class FallbackBackend:
+    """
+    Uses the warm-engine backend and falls back to pytesseract when it fails.
+
+    After the first failure the primary backend is not tried again in this
+    process, so a broken install costs one failed attempt, not one per pass.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+        self.primary_failed = False
+
+    def _call(self, method, img, cfg):
+        if not self.primary_failed:
+            try:
+                return getattr(self.primary, method)(img, cfg)
+            except RuntimeError as e:
+                # tesserocr raises RuntimeError when an engine cannot be initialised
+                self.primary_failed = True
+                print(f"{self.primary.name} failed, using {self.fallback.name} from now on: {str(e)}")
+        return getattr(self.fallback, method)(img, cfg)
+
+    def image_to_string(self, img, cfg):
+        return self._call('image_to_string', img, cfg)
+
+    def image_to_data(self, img, cfg):
+        return self._call('image_to_data', img, cfg)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Get the OCR backend for this process, creating it on first use.
+
+    Returns:
+        The backend object; call backend.image_to_string(img, cfg) or
+        backend.image_to_data(img, cfg)
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if OCR_BACKEND == 'pytesseract' or tesserocr is None:
+                _backend = PytesseractBackend()
+            else:
+                _backend = FallbackBackend(TesserocrBackend(), PytesseractBackend())
+        return _backend
+
+
+def init_worker():
+    """Process pool initializer: pick the backend once when a worker starts."""
+    get_backend()
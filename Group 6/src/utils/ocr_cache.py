@@ -0,0 +1,159 @@
+"""
+Content-addressed cache for OCR results.
+
+Entries are keyed by the hash of the image bytes plus an identifier of the
+preprocessing/OCR configuration that produced them, so processing the same
+label photo again costs a lookup instead of a full OCR run. A bounded
+in-memory LRU sits in front of a SQLite file that survives restarts and is
+shared by every app worker on the node. The file is capped at
+OCR_CACHE_MAX_ENTRIES results; the oldest ones are pruned beyond that.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from utils.common import INSTANCE_DIR
+
+# Where the persistent tier lives
+OCR_CACHE_PATH = os.path.join(INSTANCE_DIR, 'ocr_cache.sqlite3')
+
+# Maximum number of results kept in memory
+OCR_CACHE_MEMORY_SIZE = 256
+
+# Maximum number of results kept in SQLite, and how many writes go by
+# between two checks of that limit
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('EATFIT_OCR_CACHE_MAX_ENTRIES', 20000))
+OCR_CACHE_PRUNE_EVERY = 100
+
+
+class OCRCache:
+    """Two-tier (memory LRU + SQLite) store of OCR results."""
+
+    def __init__(self, path=OCR_CACHE_PATH, memory_size=OCR_CACHE_MEMORY_SIZE, max_entries=OCR_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self._writes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ocr_results ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ocr_results_created ON ocr_results (created)')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(image_hash, config_id):
+        return f"{image_hash}:{config_id}"
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, image_hash, config_id):
+        """
+        Look up a cached OCR result.
+
+        Args:
+            image_hash: Content hash of the image bytes
+            config_id: Identifier of the preprocessing/OCR configuration
+
+        Returns:
+            The cached result, or None on a miss
+        """
+        key = self.make_key(image_hash, config_id)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM ocr_results WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"OCR cache read error: {str(e)}")
+            return None
+
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def put(self, image_hash, config_id, value):
+        """Store an OCR result (must be JSON serialisable) in both tiers."""
+        key = self.make_key(image_hash, config_id)
+        self._remember(key, value)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO ocr_results (key, value, created) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"OCR cache write error: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes % OCR_CACHE_PRUNE_EVERY == 1
+        if due:
+            self.prune()
+
+    def prune(self):
+        """Delete the oldest results beyond max_entries from the SQLite tier."""
+        try:
+            conn = self._connection()
+            with conn:
+                removed = conn.execute(
+                    'DELETE FROM ocr_results WHERE key IN ('
+                    'SELECT key FROM ocr_results ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                ).rowcount
+        except sqlite3.Error as e:
+            print(f"OCR cache prune error: {str(e)}")
+            return
+        if removed:
+            print(f"Pruned {removed} old OCR cache entries")
+
+    def clear(self):
+        """Drop every cached result from both tiers."""
+        with self._lock:
+            self._memory.clear()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('DELETE FROM ocr_results')
+        except sqlite3.Error as e:
+            print(f"OCR cache clear error: {str(e)}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """Get the process-wide OCR result cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OCRCache()
+        return _cache
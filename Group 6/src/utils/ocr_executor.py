@@ -0,0 +1,204 @@
+"""
+Process-pool executor for fanning OCR jobs out across CPU cores.
+"""
+import os
+import atexit
+import time
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from utils.ocr_backends import init_worker
+
+# Number of OCR worker processes (one per core unless overridden)
+OCR_WORKERS = int(os.environ.get('EATFIT_OCR_WORKERS', os.cpu_count() or 1))
+
+# How workers are started. Forking the multi-threaded web process could copy
+# a lock another thread holds into the worker, so they come from a fork
+# server, or are spawned where there is none (Windows)
+OCR_START_METHOD = os.environ.get('EATFIT_OCR_START_METHOD') or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+# Times a job is submitted again after the pool it was running on broke
+OCR_JOB_RETRIES = 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Get the shared OCR process pool, creating it on first use.
+
+    Each worker keeps its OCR engines loaded for as long as it lives, so
+    requests after the first one skip engine startup entirely.
+
+    Returns:
+        ProcessPoolExecutor: The pool shared by every request in this process
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=init_worker,
+                                            mp_context=multiprocessing.get_context(OCR_START_METHOD))
+        return _executor
+
+
+def _discard_executor(executor):
+    """
+    Drop a pool that failed, so the next job gets a fresh one.
+
+    Only that pool is shut down, and only if it is still the shared one: a
+    pool another thread already created in its place (and the jobs other
+    requests have on it) is left alone.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return
+        _executor = None
+    executor.shutdown(wait=False)
+
+
+def shutdown_executor(wait_for_jobs=False):
+    """Shut down the shared OCR pool. A new one is created on the next job."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait_for_jobs, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown_executor)
+
+
+def _deadline_passed(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _run_sequential(func, jobs, on_result, on_error, deadline=None):
+    """Run jobs one after another in the calling process."""
+    for job in jobs:
+        if _deadline_passed(deadline):
+            return True
+        try:
+            result = func(*job)
+        except Exception as e:
+            if on_error:
+                on_error(job, e)
+            continue
+        if on_result(job, result):
+            return True
+    return False
+
+
+def fan_out(func, jobs, on_result, on_error=None, max_in_flight=None, deadline=None):
+    """
+    Run func(*job) for every job across the OCR process pool.
+
+    Jobs are pulled from the iterable only as worker slots free up, so a lazy
+    job generator never has more than max_in_flight jobs materialised at once.
+    Results are handed to on_result in the calling process as soon as they
+    arrive, in completion order. When on_result returns True, every job that
+    has not started yet is cancelled and fan_out returns immediately; jobs
+    already running finish in the background and their results are dropped.
+    The same happens when the deadline passes, even while a job is running
+    (in the sequential fallback, a running job can't be interrupted).
+
+    When a worker dies, the pool breaks: it is replaced and the jobs that
+    were on it are submitted again to the new one (once each).
+
+    Args:
+        func: Top-level (picklable) function to run in the workers
+        jobs: Iterable of argument tuples, one per job
+        on_result: Callback on_result(job, result) -> bool (True to stop early)
+        on_error: Optional callback on_error(job, exception)
+        max_in_flight: Jobs submitted but not finished (default: 2 per worker)
+        deadline: Optional time.monotonic() value after which no more
+            results are waited for
+
+    Returns:
+        bool: True if the jobs were stopped early, False if all of them ran
+    """
+    jobs = iter(jobs)
+    if OCR_WORKERS <= 1:
+        return _run_sequential(func, jobs, on_result, on_error, deadline)
+
+    max_in_flight = max_in_flight or OCR_WORKERS * 2
+    futures = {}  # future -> (job, pool it runs on, retries left)
+    # Jobs whose pool broke, submitted again before any new job
+    retry = []
+    # Jobs that could not be submitted; they run in-process once the pool drains
+    overflow = []
+
+    def submit(job, retries):
+        for _ in range(2):
+            executor = get_executor()
+            try:
+                futures[executor.submit(func, *job)] = (job, executor, retries)
+                return
+            except BrokenProcessPool:
+                # A worker died while the pool was idle; try once more on a fresh pool
+                _discard_executor(executor)
+            except (OSError, NotImplementedError, RuntimeError) as e:
+                # Platforms without working multiprocessing still get an answer
+                print(f"OCR pool unavailable, running sequentially: {str(e)}")
+                _discard_executor(executor)
+                break
+        overflow.append(job)
+
+    def fill_window():
+        while not overflow and len(futures) < max_in_flight:
+            if retry:
+                job, retries = retry.pop(0)
+            else:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                retries = OCR_JOB_RETRIES
+            submit(job, retries)
+
+    def cancel_remaining():
+        # Only this call's jobs; other requests share the pool
+        for remaining in futures:
+            remaining.cancel()
+
+    fill_window()
+    while futures:
+        timeout = None if deadline is None else max(0, deadline - time.monotonic())
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Out of time while jobs were still running
+            cancel_remaining()
+            return True
+        for future in done:
+            job, executor, retries = futures.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. killed by the OOM killer), which breaks the
+                # whole pool; the job runs again on a fresh one
+                _discard_executor(executor)
+                if retries:
+                    retry.append((job, retries - 1))
+                elif on_error:
+                    on_error(job, e)
+                continue
+            except Exception as e:
+                if on_error:
+                    on_error(job, e)
+                continue
+
+            if on_result(job, result):
+                cancel_remaining()
+                return True
+        if _deadline_passed(deadline):
+            cancel_remaining()
+            return True
+        fill_window()
+
+    if overflow or retry:
+        remaining = itertools.chain(overflow, (job for job, _ in retry), jobs)
+        return _run_sequential(func, remaining, on_result, on_error, deadline)
+    return False
@@ -0,0 +1,162 @@
+"""
+Adaptive scheduling of OCR passes.
+
+Every (image variant, OCR config) pair is tracked with the number of
+nutrients it read and the time it took. Pairs are then tried in order of
+expected nutrients per millisecond, so the productive passes run first and
+the early-termination check in enhanced_ocr can cut the rest.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from utils.common import INSTANCE_DIR
+from utils.single_flight import FileLock
+
+# Where the pass statistics are persisted between restarts
+OCR_STATS_PATH = os.path.join(INSTANCE_DIR, 'ocr_pass_stats.json')
+
+# Optimistic prior for pairs with little history, so every pair gets explored
+PRIOR_NUTRIENTS = 4.0
+PRIOR_MS = 1000.0
+
+# New observations are written out once this many passes or seconds have
+# accumulated (and at exit), not after every upload
+SAVE_EVERY_RUNS = 200
+SAVE_EVERY_SECONDS = 60
+
+# How long a save waits for another worker's save; on timeout the
+# observations stay pending until the next save
+SAVE_LOCK_WAIT_SECONDS = 5
+
+
+def _pair_key(variant, cfg_idx):
+    return f"{variant}|{cfg_idx}"
+
+
+class OCRScheduler:
+    """Orders OCR passes by their observed nutrient yield per millisecond."""
+
+    def __init__(self, stats_path=OCR_STATS_PATH):
+        self.stats_path = stats_path
+        self._lock = threading.Lock()
+        self._stats = self._load()
+        # Observations not yet written to disk, merged into the file on save()
+        self._pending = {}
+        self._pending_runs = 0
+        self._saved_at = time.monotonic()
+
+    def _load(self):
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def expected_yield(self, variant, cfg_idx):
+        """
+        Expected nutrients per millisecond for a pair.
+
+        Args:
+            variant: Name of the preprocessed image variant
+            cfg_idx: Index into OCR_CONFIGS
+
+        Returns:
+            float: Smoothed nutrients-per-ms estimate
+        """
+        stats = self._stats.get(_pair_key(variant, cfg_idx), {})
+        found = stats.get('found', 0) + PRIOR_NUTRIENTS
+        elapsed = stats.get('ms', 0) + PRIOR_MS
+        return found / elapsed
+
+    def order(self, pairs):
+        """
+        Sort (variant, cfg_idx) pairs so the most productive ones come first.
+
+        Args:
+            pairs: Iterable of (variant, cfg_idx) tuples
+
+        Returns:
+            list: The pairs, best expected yield per ms first
+        """
+        with self._lock:
+            return sorted(pairs, key=lambda pair: self.expected_yield(*pair), reverse=True)
+
+    def record(self, variant, cfg_idx, nutrients_found, elapsed_ms):
+        """Record the outcome of one OCR pass."""
+        key = _pair_key(variant, cfg_idx)
+        with self._lock:
+            for table in (self._stats, self._pending):
+                stats = table.setdefault(key, {'runs': 0, 'found': 0, 'ms': 0.0})
+                stats['runs'] += 1
+                stats['found'] += nutrients_found
+                stats['ms'] += elapsed_ms
+            self._pending_runs += 1
+
+    def maybe_save(self):
+        """Save if enough observations or time have accumulated since the last save."""
+        with self._lock:
+            due = (self._pending_runs >= SAVE_EVERY_RUNS or
+                   (self._pending and time.monotonic() - self._saved_at >= SAVE_EVERY_SECONDS))
+        if due:
+            self.save()
+
+    def save(self):
+        """
+        Persist the statistics.
+
+        The file is re-read first and only this process's new observations are
+        added, so several app workers can share one statistics file. The
+        read-merge-write runs under a lock file, so two workers saving at once
+        don't lose each other's observations.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+        file_lock = FileLock(f"{self.stats_path}.lock")
+        if not file_lock.acquire(timeout=SAVE_LOCK_WAIT_SECONDS):
+            print("OCR statistics file is locked, saving later")
+            return
+        try:
+            self._save_locked()
+        finally:
+            file_lock.release()
+
+    def _save_locked(self):
+        with self._lock:
+            if not self._pending:
+                return
+            stats = self._load()
+            for key, delta in self._pending.items():
+                merged = stats.setdefault(key, {'runs': 0, 'found': 0, 'ms': 0.0})
+                for field in ('runs', 'found', 'ms'):
+                    merged[field] += delta[field]
+            try:
+                os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+                tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(stats, f, indent=1, sort_keys=True)
+                os.replace(tmp_path, self.stats_path)
+            except OSError as e:
+                print(f"Could not save OCR statistics: {str(e)}")
+                return
+            self._stats = stats
+            self._pending = {}
+            self._pending_runs = 0
+            self._saved_at = time.monotonic()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Get the process-wide OCR scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OCRScheduler()
+            # Whatever was not saved yet is written when the process exits
+            atexit.register(_scheduler.save)
+        return _scheduler
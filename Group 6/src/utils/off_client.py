@@ -0,0 +1,333 @@
+"""
+Shared HTTP client for the Open Food Facts API.
+
+Every OFF request goes through one pooled keep-alive session, so
+connections are reused between calls and threads. Each call has connect
+and read timeouts. Connection errors, timeouts and overload responses are
+retried a bounded number of times with jittered exponential backoff.
+
+A circuit breaker stops calling OFF for a while after several calls in a
+row have failed, so requests fail fast instead of each one waiting out its
+timeouts while OFF is down. Once the break is over, one trial call decides
+whether to close the circuit again.
+
+Products are kept in the tiered product cache (see product_cache), so
+repeat lookups of a barcode need no request at all while it is fresh.
+Concurrent lookups of a barcode that isn't cached share one request, within
+a worker and across the workers on a node (see single_flight). Before any of
+that, products are looked up in the local OFF mirror, when one was imported
+(see off_mirror).
+"""
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from utils.product_cache import get_product_cache
+from utils.single_flight import SingleFlight
+from utils.off_mirror import get_off_mirror
+
+logger = logging.getLogger(__name__)
+
+OFF_BASE_URL = os.environ.get('EATFIT_OFF_URL', 'https://world.openfoodfacts.org')
+
+# OFF asks API clients to identify themselves
+OFF_USER_AGENT = 'EatFit/1.0 (TE Mini Project)'
+
+# Connect and read timeouts in seconds; searches get a longer read timeout
+OFF_CONNECT_TIMEOUT = 3.05
+OFF_READ_TIMEOUT = float(os.environ.get('EATFIT_OFF_READ_TIMEOUT', '10'))
+OFF_SEARCH_READ_TIMEOUT = 15
+
+# Keep-alive connections kept open to OFF (roughly one per app thread)
+OFF_POOL_SIZE = 10
+
+# Retries after the first attempt, and the base of the backoff between them
+OFF_RETRIES = 2
+OFF_BACKOFF_SECONDS = 0.5
+
+# Responses that mean OFF is overloaded or restarting, worth another try
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Request errors worth another try; any other request error fails the call at once
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# Consecutive failed calls that open the circuit, and how long it stays open
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 30
+
+# Product fields each consumer reads. OFF is asked for these fields only (a
+# full product document is often hundreds of KB), and each consumer gets
+# back only the fields in its manifest, so a field that is read has to be
+# declared here.
+PRODUCT_FIELDS = {
+    # Inputs of the clean-up in get_product_from_off
+    'get_product_from_off': [
+        'additives_tags', 'additives_original_tags', 'additives_old_tags',
+        'ingredients_analysis_tags', 'allergens_tags', 'traces_tags',
+        'ingredients_from_palm_oil_n', 'vegan', 'nova_group',
+    ],
+    'analyze_product_with_off': [
+        'product_name', 'brands', 'image_url', 'nutriscore_grade', 'serving_size',
+    ],
+    'process_with_config': [
+        'product_name', 'brands', 'nutriments', 'categories', 'image_url',
+        'ingredients_text', 'nova_groups',
+    ],
+    'product_details': [
+        'product_name', 'brands', 'image_url', 'nutriments', 'ingredients_text',
+        'nutriscore_grade', 'ingredients',
+    ],
+    'allergies': ['ingredients_text'],
+    'alternatives': [
+        'categories_hierarchy', 'categories_tags', 'nutriments', 'nova_group', 'nutrition_grades',
+    ],
+}
+ALL_PRODUCT_FIELDS = sorted({field for fields in PRODUCT_FIELDS.values() for field in fields})
+
+# Fields of each product in a search result (alternatives)
+SEARCH_FIELDS = ['code', 'product_name', 'brands', 'image_url', 'nutriments', 'nutrition_grades', 'nova_group']
+
+
+def project(product, fields):
+    """Keep only the given fields of a product (None stays None)."""
+    if product is None:
+        return None
+    return {field: product[field] for field in fields if field in product}
+
+
+class OFFUnavailable(Exception):
+    """Open Food Facts could not be reached (or the circuit is open)."""
+
+
+class CircuitBreaker:
+    """Counts consecutive failures and blocks calls for a while after too many."""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Decide whether a call may go out now.
+
+        Returns:
+            bool: True while closed, and for the single trial call after the break
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                if self._opened_at is None:
+                    logger.warning("Open Food Facts failed %d times in a row, pausing calls for %ds",
+                                   self._consecutive, self.reset_seconds)
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class OFFClient:
+    """Pooled, retrying Open Food Facts client behind a circuit breaker."""
+
+    def __init__(self, base_url=OFF_BASE_URL, retries=OFF_RETRIES, backoff=OFF_BACKOFF_SECONDS,
+                 cache=None, mirror=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.mirror = mirror
+        self._product_flight = SingleFlight('off-product')
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = OFF_USER_AGENT
+        # Retries are done here, so the adapter itself never retries
+        adapter = HTTPAdapter(pool_connections=OFF_POOL_SIZE, pool_maxsize=OFF_POOL_SIZE, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_json(self, path, params=None, read_timeout=OFF_READ_TIMEOUT):
+        """
+        GET an OFF API path and decode the JSON body.
+
+        Args:
+            path: Path below the base URL, e.g. '/api/v0/product/123.json'
+            params: Optional query parameters
+            read_timeout: Seconds to wait for the response once connected
+
+        Returns:
+            tuple: (status_code, data); data is None when the body is not JSON
+
+        Raises:
+            OFFUnavailable: If the circuit is open or the request failed
+        """
+        if not self.breaker.allow():
+            raise OFFUnavailable("Open Food Facts is temporarily unavailable")
+
+        url = f"{self.base_url}{path}"
+        error = None
+        attempts = 0
+        succeeded = False
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    # Full jitter, so retries from many threads don't arrive together
+                    time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+                attempts += 1
+                try:
+                    response = self.session.get(url, params=params, timeout=(OFF_CONNECT_TIMEOUT, read_timeout))
+                except RETRY_ERRORS as e:
+                    error = e
+                    continue
+                except requests.RequestException as e:
+                    # Retrying won't help (bad URL, redirect loop, undecodable body)
+                    error = e
+                    break
+                if response.status_code in RETRY_STATUSES:
+                    error = f"HTTP {response.status_code}"
+                    continue
+
+                succeeded = True
+                try:
+                    return response.status_code, response.json()
+                except ValueError:
+                    return response.status_code, None
+        finally:
+            # Every way out records an outcome, which also ends a half-open trial call
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+        raise OFFUnavailable(f"Open Food Facts request failed after {attempts} attempts: {error}")
+
+    def get_product(self, barcode, fields=None, refresh=False):
+        """
+        Get one product by barcode: from the local mirror if it has it, else
+        from the cache while it is fresh, else from OFF.
+
+        Args:
+            barcode: The product barcode
+            fields: Fields the caller reads, normally one of the PRODUCT_FIELDS
+                manifests; the product is returned with only these fields
+            refresh: Fetch from OFF even if the cached product is fresh
+
+        Returns:
+            dict: The OFF product (the caller's own copy), or None if OFF
+                doesn't know the barcode
+
+        Raises:
+            OFFUnavailable: If OFF could not be reached and nothing is cached
+        """
+        fields = list(fields) if fields else ALL_PRODUCT_FIELDS
+        if self.mirror is not None and not refresh:
+            product = self.mirror.get(barcode, fields)
+            if product is not None:
+                return product
+
+        cached = self.cache.get(barcode, fields) if self.cache is not None else None
+        if cached is not None and cached[1] and not refresh:
+            return project(cached[0], fields)
+
+        # Every consumer's fields in one request, so they all share the cache entry
+        fetch_fields = sorted(set(ALL_PRODUCT_FIELDS) | set(fields))
+
+        def fetch():
+            try:
+                product = self.fetch_product(barcode, fetch_fields)
+            except OFFUnavailable:
+                if cached is None:
+                    raise
+                logger.warning("Open Food Facts unavailable, using stale cached product %s", barcode)
+                return cached[0]
+            if self.cache is not None:
+                self.cache.put(barcode, product, fetch_fields)
+            return product
+
+        def fetched_by_another_worker():
+            if self.cache is None or refresh:
+                return False, None
+            shared = self.cache.get(barcode, fields, memory=False)
+            if shared is not None and shared[1]:
+                return True, shared[0]
+            return False, None
+
+        return project(self._product_flight.do(barcode, fetch, fetched_by_another_worker), fields)
+
+    def fetch_product(self, barcode, fields=None):
+        """
+        Fetch one product from OFF, bypassing the cache.
+
+        Args:
+            barcode: The product barcode
+            fields: Fields to request (None for the whole document)
+
+        Returns:
+            dict: The OFF product, or None if OFF doesn't know the barcode
+
+        Raises:
+            OFFUnavailable: If OFF could not be reached or gave no usable answer
+        """
+        params = {'fields': ','.join(fields)} if fields else None
+        status_code, data = self.get_json(f"/api/v0/product/{barcode}.json", params=params)
+        if status_code not in (200, 404) or data is None:
+            # Not an answer about the barcode, so it must not be cached as unknown
+            raise OFFUnavailable(f"Unexpected Open Food Facts response (HTTP {status_code})")
+        if data.get('status') != 1 or 'product' not in data:
+            return None
+        return data['product']
+
+    def search(self, params, fields=SEARCH_FIELDS):
+        """
+        Run a product search (cgi/search.pl).
+
+        Args:
+            params: Search parameters
+            fields: Fields returned for each product
+
+        Returns:
+            list: The products in the result page, empty if the search failed
+
+        Raises:
+            OFFUnavailable: If OFF could not be reached
+        """
+        status_code, data = self.get_json('/cgi/search.pl', params=dict(params, json=1, fields=','.join(fields)),
+                                          read_timeout=OFF_SEARCH_READ_TIMEOUT)
+        if status_code != 200 or not data:
+            return []
+        return data.get('products', [])
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_off_client():
+    """Get the process-wide Open Food Facts client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OFFClient(cache=get_product_cache(), mirror=get_off_mirror())
+        return _client
@@ -0,0 +1,260 @@
+"""
+Local mirror of Open Food Facts products.
+
+An OFF data export (the JSONL product dump or the tab-separated CSV export,
+optionally gzipped, or one of the daily delta files) is imported into a
+SQLite file keyed by barcode. Product lookups check the mirror first, which
+is a primary key read on a local file, and only go to the live API for
+barcodes the mirror doesn't have. With a mirror in place the app can run
+without network access to OFF.
+
+Only the fields some consumer declares (off_client.PRODUCT_FIELDS) are
+stored. Imports are incremental: a product is only replaced when the
+imported copy was modified later than the stored one, so delta files can
+be applied in any order and a dump can be re-imported cheaply.
+"""
+import os
+import csv
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import threading
+from utils.common import INSTANCE_DIR
+
+# Where the mirror lives
+OFF_MIRROR_PATH = os.environ.get('EATFIT_OFF_MIRROR', os.path.join(INSTANCE_DIR, 'off_mirror.sqlite3'))
+
+# Products written per transaction while importing
+IMPORT_BATCH_SIZE = 5000
+
+# The CSV export flattens products: tag lists are comma-separated and every
+# per-100g nutrient is its own column
+CSV_NUTRIMENT_SUFFIX = '_100g'
+CSV_INT_FIELDS = {'nova_group', 'ingredients_from_palm_oil_n'}
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def product_from_csv_row(row):
+    """
+    Rebuild a product document (as the API returns it) from a CSV export row.
+
+    Returns:
+        dict: The product (other columns such as 'code' and 'last_modified_t' are kept as text)
+    """
+    product = {}
+    nutriments = {}
+    for column, value in row.items():
+        if value in (None, ''):
+            continue
+        if column.endswith(CSV_NUTRIMENT_SUFFIX):
+            number = _number(value)
+            if number is not None:
+                nutriments[column] = number
+        elif column.endswith('_tags') or column.endswith('_hierarchy'):
+            product[column] = [tag for tag in value.split(',') if tag]
+        elif column in CSV_INT_FIELDS:
+            number = _number(value)
+            if number is not None:
+                product[column] = int(number)
+        else:
+            product[column] = value
+    product['nutriments'] = nutriments
+
+    # Fields the export only has under another name
+    if 'categories_hierarchy' not in product and 'categories_tags' in product:
+        product['categories_hierarchy'] = product['categories_tags']
+    if 'nutrition_grades' not in product and 'nutriscore_grade' in product:
+        product['nutrition_grades'] = product['nutriscore_grade']
+    if 'energy-kcal_100g' in nutriments and 'energy-kcal' not in nutriments:
+        nutriments['energy-kcal'] = nutriments['energy-kcal_100g']
+    return product
+
+
+def read_dump(path):
+    """
+    Yield the products of an OFF export file.
+
+    Args:
+        path: JSONL or CSV export (by extension, optionally .gz)
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open_text(path) as f:
+        if name.endswith('.csv') or name.endswith('.tsv'):
+            csv.field_size_limit(sys.maxsize)
+            for row in csv.DictReader(f, delimiter='\t'):
+                yield product_from_csv_row(row)
+        else:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class OFFMirror:
+    """Barcode-indexed SQLite store of OFF products, filled by import_dump."""
+
+    def __init__(self, path=OFF_MIRROR_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self, create=False):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not create and not os.path.exists(self.path):
+                return None  # No mirror imported (yet)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS products ('
+                'barcode TEXT PRIMARY KEY, product TEXT NOT NULL, last_modified INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def fields(self):
+        """The fields the mirror stores, or None if nothing was imported."""
+        conn = self._connection()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT value FROM meta WHERE key = 'fields'").fetchone()
+        return row[0].split(',') if row else None
+
+    def get(self, barcode, fields):
+        """
+        Look up a product in the mirror.
+
+        Args:
+            barcode: The product barcode
+            fields: Fields the caller needs
+
+        Returns:
+            dict: The product with those fields, or None if the mirror doesn't
+                have the product (or was imported without one of the fields)
+        """
+        try:
+            conn = self._connection()
+            if conn is None:
+                return None
+            stored = getattr(self._local, 'fields', None)
+            if not stored:
+                # Re-read until an import has run, so a mirror imported while the app is up gets used
+                stored = self._local.fields = set(self.fields() or ())
+            if not set(fields) <= stored:
+                return None
+            row = conn.execute('SELECT product FROM products WHERE barcode = ?', (barcode,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"OFF mirror read error: {str(e)}")
+            return None
+        if row is None:
+            return None
+        product = json.loads(row[0])
+        return {field: product[field] for field in fields if field in product}
+
+    def products(self):
+        """Yield (barcode, product) for every product in the mirror."""
+        conn = self._connection()
+        if conn is None:
+            return
+        for barcode, product in conn.execute('SELECT barcode, product FROM products'):
+            yield barcode, json.loads(product)
+
+    def import_dump(self, path, fields, progress=None):
+        """
+        Import (or update from) an OFF export file.
+
+        Args:
+            path: JSONL or CSV export, optionally gzipped
+            fields: Fields to keep of each product
+            progress: Optional callback progress(read, written)
+
+        Returns:
+            dict: Counts of products read, written (new or newer) and skipped
+        """
+        conn = self._connection(create=True)
+        fields = sorted(fields)
+        previous = self.fields()
+        stored_fields = fields
+        if previous is not None and previous != fields:
+            # Products imported before only have the old fields, so the mirror
+            # only vouches for fields in both; clear() and re-import the full
+            # dump to get the new ones everywhere
+            stored_fields = sorted(set(previous) & set(fields))
+            print("Mirror fields changed since the last import, re-import the full dump to use the new ones",
+                  file=sys.stderr)
+
+        counts = {'read': 0, 'written': 0, 'skipped': 0}
+        batch = []
+
+        def flush():
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    'INSERT INTO products (barcode, product, last_modified) VALUES (?, ?, ?) '
+                    'ON CONFLICT(barcode) DO UPDATE SET product = excluded.product, '
+                    'last_modified = excluded.last_modified '
+                    'WHERE excluded.last_modified > products.last_modified',
+                    batch
+                )
+                counts['written'] += conn.total_changes - before
+            batch.clear()
+            if progress:
+                progress(counts['read'], counts['written'])
+
+        for product in read_dump(path):
+            barcode = str(product.get('code') or '').strip()
+            if not barcode:
+                counts['skipped'] += 1
+                continue
+            counts['read'] += 1
+            kept = {field: product[field] for field in fields if field in product}
+            batch.append((barcode, json.dumps(kept, separators=(',', ':')),
+                          int(_number(product.get('last_modified_t')) or 0)))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fields', ?)", (','.join(stored_fields),))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported', ?)", (str(int(time.time())),))
+        self._local.fields = None
+        return counts
+
+    def clear(self):
+        """Drop every product from the mirror."""
+        conn = self._connection(create=True)
+        with conn:
+            conn.execute('DELETE FROM products')
+            conn.execute('DELETE FROM meta')
+        self._local.fields = None
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_off_mirror():
+    """Get the process-wide OFF mirror."""
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = OFFMirror()
+        return _mirror
@@ -0,0 +1,190 @@
+"""
+Tiered cache of Open Food Facts products.
+
+Products are looked up by barcode in a small in-memory LRU first, then in a
+SQLite file shared by every app worker on the node, and only then fetched
+from OFF. Both tiers know when each product was fetched, so a product stays
+fresh for PRODUCT_CACHE_TTL_SECONDS. Barcodes OFF doesn't know are
+remembered too, for a shorter PRODUCT_CACHE_MISS_TTL_SECONDS.
+
+Each entry also records which product fields were fetched (None for the
+whole document); an entry missing a field a caller needs doesn't count as
+fresh for that caller.
+
+Memory entries are re-checked against SQLite after
+PRODUCT_CACHE_MEMORY_SECONDS, so an invalidation in one worker reaches the
+others within that time. Stale entries are kept: when OFF can't be
+reached, a stale product is better than none.
+"""
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from utils.common import INSTANCE_DIR
+
+# Where the persistent tier lives
+PRODUCT_CACHE_PATH = os.path.join(INSTANCE_DIR, 'product_cache.sqlite3')
+
+# Maximum number of products kept in memory
+PRODUCT_CACHE_MEMORY_SIZE = 512
+
+# How long a fetched product, and a barcode OFF didn't know, count as fresh
+PRODUCT_CACHE_TTL_SECONDS = int(os.environ.get('EATFIT_PRODUCT_CACHE_TTL', 24 * 60 * 60))
+PRODUCT_CACHE_MISS_TTL_SECONDS = int(os.environ.get('EATFIT_PRODUCT_CACHE_MISS_TTL', 60 * 60))
+
+# How long a worker trusts its memory tier before re-reading SQLite
+PRODUCT_CACHE_MEMORY_SECONDS = 60
+
+
+class ProductCache:
+    """Two-tier (memory LRU + SQLite) store of OFF products with freshness."""
+
+    def __init__(self, path=PRODUCT_CACHE_PATH, memory_size=PRODUCT_CACHE_MEMORY_SIZE,
+                 ttl=PRODUCT_CACHE_TTL_SECONDS, miss_ttl=PRODUCT_CACHE_MISS_TTL_SECONDS):
+        self.path = path
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._memory = OrderedDict()  # barcode -> (product, fields, fetched, remembered)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS products ('
+                'barcode TEXT PRIMARY KEY, product TEXT, fetched REAL NOT NULL, fields TEXT)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(products)')]
+            if 'fields' not in columns:
+                # Files from before field selection hold whole documents (fields NULL)
+                conn.execute('ALTER TABLE products ADD COLUMN fields TEXT')
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, barcode, product, fields, fetched):
+        with self._lock:
+            self._memory[barcode] = (product, fields, fetched, time.monotonic())
+            self._memory.move_to_end(barcode)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def is_fresh(self, product, fetched, cached_fields=None, fields=None, now=None):
+        """
+        Whether an entry fetched at `fetched` (time.time()) is still fresh.
+
+        An entry holding only some fields is not fresh for callers that need others.
+        """
+        if product is not None and cached_fields is not None and fields and not set(fields) <= set(cached_fields):
+            return False
+        ttl = self.ttl if product is not None else self.miss_ttl
+        return (now or time.time()) - fetched < ttl
+
+    def get(self, barcode, fields=None, memory=True):
+        """
+        Look up a product.
+
+        Args:
+            barcode: The product barcode
+            fields: Fields the caller needs (None for any entry)
+            memory: False to skip the memory tier and read what all workers share
+
+        Returns:
+            tuple: (product, fresh), where product is None for a barcode OFF
+                didn't know; None if the barcode was never fetched
+        """
+        with self._lock:
+            entry = self._memory.get(barcode) if memory else None
+            if entry is not None and time.monotonic() - entry[3] < PRODUCT_CACHE_MEMORY_SECONDS:
+                self._memory.move_to_end(barcode)
+                product, cached_fields, fetched, _ = entry
+                return copy.deepcopy(product), self.is_fresh(product, fetched, cached_fields, fields)
+
+        try:
+            row = self._connection().execute(
+                'SELECT product, fetched, fields FROM products WHERE barcode = ?', (barcode,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Product cache read error: {str(e)}")
+            return None
+
+        if row is None:
+            with self._lock:
+                self._memory.pop(barcode, None)
+            return None
+        product = json.loads(row[0]) if row[0] is not None else None
+        cached_fields = row[2].split(',') if row[2] else None
+        self._remember(barcode, product, cached_fields, row[1])
+        # Callers may change the product they get, so they get their own copy
+        return copy.deepcopy(product), self.is_fresh(product, row[1], cached_fields, fields)
+
+    def put(self, barcode, product, fields=None):
+        """
+        Store a freshly fetched product (None if OFF didn't know the barcode).
+
+        Args:
+            barcode: The product barcode
+            product: The product document
+            fields: The fields that were requested, None for the whole document
+        """
+        fetched = time.time()
+        fields = sorted(fields) if fields else None
+        self._remember(barcode, copy.deepcopy(product), fields, fetched)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO products (barcode, product, fetched, fields) VALUES (?, ?, ?, ?)',
+                    (barcode, json.dumps(product) if product is not None else None, fetched,
+                     ','.join(fields) if fields else None)
+                )
+        except sqlite3.Error as e:
+            print(f"Product cache write error: {str(e)}")
+
+    def products(self):
+        """Yield (barcode, product) for every product in the persistent tier, fresh or stale."""
+        for barcode, product in self._connection().execute(
+                'SELECT barcode, product FROM products WHERE product IS NOT NULL'):
+            yield barcode, json.loads(product)
+
+    def invalidate(self, barcode=None):
+        """
+        Forget one product, or every product when no barcode is given.
+
+        Other workers drop their memory copy within PRODUCT_CACHE_MEMORY_SECONDS.
+        """
+        with self._lock:
+            if barcode is None:
+                self._memory.clear()
+            else:
+                self._memory.pop(barcode, None)
+        try:
+            conn = self._connection()
+            with conn:
+                if barcode is None:
+                    conn.execute('DELETE FROM products')
+                else:
+                    conn.execute('DELETE FROM products WHERE barcode = ?', (barcode,))
+        except sqlite3.Error as e:
+            print(f"Product cache invalidate error: {str(e)}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_product_cache():
+    """Get the process-wide product cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProductCache()
+        return _cache
@@ -0,0 +1,238 @@
+"""
+Quick image quality checks that run before any OCR.
+
+A photo that is tiny, blurred, washed out or has no text in view makes
+every OCR pass fail, just slowly. check_image measures these properties on a
+small grayscale copy, which takes a few milliseconds. Hopeless photos are
+rejected with a message that tells the user what to fix. Fixable ones are
+corrected: low contrast is stretched and a sideways photo is turned upright.
+
+Every decision is appended to a JSON lines log with the measurements and
+timings, so the thresholds below can be tuned on real uploads.
+"""
+import os
+import json
+import time
+import threading
+import cv2
+import numpy as np
+from utils.common import INSTANCE_DIR
+
+# Off switch for the whole gate
+QUALITY_GATE_ENABLED = os.environ.get('EATFIT_QUALITY_GATE', '1') != '0'
+
+# Measurements are taken on a copy scaled to this width
+QUALITY_WORK_WIDTH = 800
+
+# Shorter side (pixels) below which a photo is too small to read
+QUALITY_MIN_SIDE = 250
+
+# Fraction of pixels at the ends of the histogram that means a photo
+# without readable text is washed out by glare or too dark
+QUALITY_CLIP_LOW = 5
+QUALITY_CLIP_HIGH = 250
+QUALITY_MAX_CLIPPED = 0.5
+
+# Spread between the 2nd and 98th brightness percentiles: below the first the
+# photo is blank, below the second its contrast is stretched
+QUALITY_MIN_CONTRAST = 12
+QUALITY_STRETCH_CONTRAST = 60
+
+# Variance of the Laplacian (at the working width) below which a photo is too blurred
+QUALITY_MIN_SHARPNESS = float(os.environ.get('EATFIT_QUALITY_MIN_SHARPNESS', '25'))
+
+# Minimum fraction of the photo covered by text-like strokes
+QUALITY_MIN_TEXT_AREA = float(os.environ.get('EATFIT_QUALITY_MIN_TEXT_AREA', '0.005'))
+QUALITY_MIN_EDGE = 20
+# Largest character (pixels, at the working width); bigger blobs are rules or pictures
+QUALITY_MAX_CHAR = 40
+
+# Vertical text must outweigh horizontal text this much to turn the photo
+QUALITY_SIDEWAYS_RATIO = 2.0
+
+# Where decisions are logged, and the size at which the log is rotated
+QUALITY_LOG_PATH = os.path.join(INSTANCE_DIR, 'quality_gate.jsonl')
+QUALITY_LOG_MAX_BYTES = 5 * 1024 * 1024
+
+
+def _line_area(chars, kernel_size, horizontal):
+    """Fraction of the image covered by text-line-shaped blobs in one direction."""
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+    joined = cv2.morphologyEx(chars, cv2.MORPH_CLOSE, kernel)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(joined, connectivity=8)
+
+    widths, heights, areas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    along, across = (widths, heights) if horizontal else (heights, widths)
+    lines = (along >= 3 * across) & (across >= 4)
+    return float(areas[lines].sum()) / chars.size
+
+
+def _text_measures(gray):
+    """
+    Measure how much of the image looks like text, and which way it runs.
+
+    Edge blobs the size of characters are kept (table rules and pictures are
+    not). Their boxes give the text area; smearing them across and down and
+    comparing how much joins into line-shaped blobs gives the orientation.
+    """
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    otsu, _ = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, mask = cv2.threshold(gradient, max(otsu, QUALITY_MIN_EDGE), 255, cv2.THRESH_BINARY)
+
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    widths, heights = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    is_char = (widths >= 2) & (heights >= 4) & (widths <= QUALITY_MAX_CHAR) & (heights <= QUALITY_MAX_CHAR)
+    is_char[0] = False  # Background
+    chars = np.where(is_char[labels], 255, 0).astype(np.uint8)
+
+    return {
+        'text_area': round(float((widths[is_char] * heights[is_char]).sum()) / gray.size, 4),
+        'text_horizontal': round(_line_area(chars, (9, 1), horizontal=True), 4),
+        'text_vertical': round(_line_area(chars, (1, 9), horizontal=False), 4),
+    }
+
+
+def measure(image):
+    """
+    Measure the properties the gate decides on.
+
+    Args:
+        image: BGR or grayscale image
+
+    Returns:
+        dict: Measurements (sizes, clipping, contrast, sharpness, text areas)
+    """
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if width > QUALITY_WORK_WIDTH:
+        gray = cv2.resize(gray, (QUALITY_WORK_WIDTH, int(height * QUALITY_WORK_WIDTH / width)),
+                          interpolation=cv2.INTER_AREA)
+
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    cumulative = np.cumsum(hist)
+    low, high = int(np.searchsorted(cumulative, 0.02)), int(np.searchsorted(cumulative, 0.98))
+    if QUALITY_MIN_CONTRAST <= high - low < QUALITY_STRETCH_CONTRAST:
+        # Measure text the way OCR will see it, after the stretch
+        gray = _stretch(gray, low, high)
+
+    metrics = {
+        'width': width,
+        'height': height,
+        'dark': round(float(hist[:QUALITY_CLIP_LOW + 1].sum()), 3),
+        'bright': round(float(hist[QUALITY_CLIP_HIGH:].sum()), 3),
+        'contrast': high - low,
+        'contrast_range': (low, high),
+        'sharpness': round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 1),
+    }
+    metrics.update(_text_measures(gray))
+    return metrics
+
+
+def decide(metrics):
+    """
+    Turn measurements into a decision.
+
+    Clipped highlights or shadows alone are no reason to reject (a white
+    label is mostly white); they only explain why no text could be found.
+
+    Returns:
+        tuple: (rejection message or None, list of corrections to apply)
+    """
+    if min(metrics['width'], metrics['height']) < QUALITY_MIN_SIDE:
+        return (f"The photo is too small ({metrics['width']}x{metrics['height']}). "
+                f"Please upload a photo at least {QUALITY_MIN_SIDE} pixels on each side."), []
+    if metrics['contrast'] < QUALITY_MIN_CONTRAST:
+        return "The photo looks blank. Please make sure the nutrition label is in view.", []
+    if metrics['sharpness'] < QUALITY_MIN_SHARPNESS:
+        return "The photo is too blurry to read. Please hold the camera steady and focus on the label.", []
+    if metrics['text_area'] < QUALITY_MIN_TEXT_AREA:
+        if metrics['bright'] > QUALITY_MAX_CLIPPED:
+            return "The photo is washed out by light or glare. Please retake it without a flash or direct light.", []
+        if metrics['dark'] > QUALITY_MAX_CLIPPED:
+            return "The photo is too dark to read. Please retake it in better light.", []
+        return "No text was found in the photo. Please take a closer photo of the nutrition label.", []
+
+    corrections = []
+    if metrics['text_vertical'] > QUALITY_SIDEWAYS_RATIO * metrics['text_horizontal']:
+        corrections.append('rotate')
+    if metrics['contrast'] < QUALITY_STRETCH_CONTRAST:
+        corrections.append('stretch')
+    return None, corrections
+
+
+def _stretch(image, low, high):
+    """Map brightness low..high onto the full 0..255 range."""
+    scale = 255.0 / max(1, high - low)
+    return cv2.convertScaleAbs(image, alpha=scale, beta=-low * scale)
+
+
+def correct(image, metrics, corrections):
+    """Apply the corrections decide() asked for."""
+    if 'rotate' in corrections:
+        # Which way round it is can't be told cheaply; clockwise covers the
+        # usual phone grip, and a wrong guess reads no worse than sideways text
+        image = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if 'stretch' in corrections:
+        image = _stretch(image, *metrics['contrast_range'])
+    return image
+
+
+class GateLog:
+    """Append-only JSON lines log of gate decisions, rotated once when too large."""
+
+    def __init__(self, path=QUALITY_LOG_PATH, max_bytes=QUALITY_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        line = json.dumps(entry, sort_keys=True)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, 'a') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                print(f"Could not log quality gate decision: {str(e)}")
+
+
+_log = GateLog()
+
+
+def check_image(image):
+    """
+    Check a decoded photo before OCR, correcting it where that helps.
+
+    Args:
+        image: BGR image
+
+    Returns:
+        tuple: (image, message) where image may be corrected and message is
+            None if OCR should go ahead, or says why the photo was rejected
+    """
+    if not QUALITY_GATE_ENABLED:
+        return image, None
+
+    start = time.perf_counter()
+    metrics = measure(image)
+    measured = time.perf_counter()
+    message, corrections = decide(metrics)
+    if corrections:
+        image = correct(image, metrics, corrections)
+    finished = time.perf_counter()
+
+    decision = 'rejected' if message else ('corrected' if corrections else 'passed')
+    print(f"Quality gate {decision} in {(finished - start) * 1000:.1f}ms"
+          + (f": {message}" if message else f" {corrections}" if corrections else ""))
+    _log.record({
+        'time': int(time.time()),
+        'decision': decision,
+        'message': message,
+        'corrections': corrections,
+        'metrics': {key: value for key, value in metrics.items() if key != 'contrast_range'},
+        'measure_ms': round((measured - start) * 1000, 2),
+        'total_ms': round((finished - start) * 1000, 2),
+    })
+    return image, message
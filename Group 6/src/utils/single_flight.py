@@ -0,0 +1,135 @@
+"""
+Single-flight coalescing of identical slow calls.
+
+When several callers ask for the same key at once, only one of them (the
+leader) does the work; the others wait for it and share its result or
+its exception. Threads in one worker coalesce in memory. Workers on the
+same node coalesce through a lock file per key: a worker that finds the
+lock taken waits for it, then checks the shared store (e.g. the SQLite
+product cache) before doing the work itself.
+
+Lock files are plain exclusively-created files, so this works on any OS.
+A lock left behind by a crashed worker is broken once it is older than
+LOCK_STALE_SECONDS.
+"""
+import os
+import copy
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+from utils.common import INSTANCE_DIR
+
+# Where the per-key lock files live
+LOCK_DIR = os.path.join(INSTANCE_DIR, 'locks')
+
+# Longest a worker waits for another worker's call before doing it itself,
+# and the age at which a lock file counts as abandoned
+LOCK_WAIT_SECONDS = 45
+LOCK_STALE_SECONDS = 60
+LOCK_POLL_SECONDS = 0.05
+
+
+class FileLock:
+    """Exclusive lock between processes, held by creating a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._held = False
+
+    def acquire(self, timeout=LOCK_WAIT_SECONDS):
+        """
+        Wait for the lock.
+
+        Returns:
+            bool: True if it was acquired, False if the wait timed out
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                self._held = True
+                return True
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(self.path) > LOCK_STALE_SECONDS:
+                    os.remove(self.path)
+                    continue
+            except OSError:
+                continue  # Released (or broken) between the two calls
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_SECONDS)
+
+    def release(self):
+        if self._held:
+            self._held = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key across threads and workers."""
+
+    def __init__(self, namespace, lock_dir=LOCK_DIR):
+        self.namespace = namespace
+        self.lock_dir = lock_dir
+        self._inflight = {}  # key -> Future of the leader's result
+        self._lock = threading.Lock()
+
+    def _lock_path(self, key):
+        # Keys may be user input, so they are hashed into the file name
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.lock_dir, f"{self.namespace}-{digest}.lock")
+
+    def do(self, key, func, recheck=None):
+        """
+        Run func() once for all concurrent callers with the same key.
+
+        Args:
+            key: What is being fetched (e.g. a barcode)
+            func: Does the work and returns its result
+            recheck: Optional function returning (True, result) if another
+                worker already produced the result, else (False, None);
+                called after waiting for another worker
+
+        Returns:
+            The result, as each caller's own copy
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = self._run_locked(key, func, recheck)
+            future.set_result(copy.deepcopy(result))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return result
+
+    def _run_locked(self, key, func, recheck):
+        file_lock = FileLock(self._lock_path(key))
+        if not file_lock.acquire():
+            print(f"Gave up waiting for another worker on {self.namespace} {key}")
+            return func()
+        try:
+            if recheck is not None:
+                found, result = recheck()
+                if found:
+                    return result
+            return func()
+        finally:
+            file_lock.release()
@@ -0,0 +1,216 @@
+"""
+Storage for uploaded label images.
+
+Uploads are stored under the hash of their content, so the same photo
+uploaded twice (or by two users) is kept once and never overwrites a
+different photo that happened to have the same file name.
+
+An upload is read into memory once and OCR starts on those bytes right
+away; the copy on disk (needed to show the image on the verify page and
+for "try another configuration") is written by a background thread.
+Anything serving the file can wait for its write to finish first.
+
+Stored files are kept while something references them: background jobs
+hold an explicit reference while they run, and sessions keep their upload
+alive by touching it whenever they use it. A background sweeper deletes
+uploads that have been unreferenced and untouched for UPLOAD_TTL_SECONDS,
+and expires old OCR debug artifacts in the same round.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.common import content_hash
+from utils.debug_sink import get_debug_sink
+
+# Where uploads go (relative to the working directory, like app.UPLOAD_FOLDER)
+UPLOAD_DIR = os.path.join('src', 'static', 'uploads')
+
+# How long a request for an upload waits for its background write
+UPLOAD_WAIT_SECONDS = 10
+
+# Unused uploads and debug artifacts are deleted after these ages
+UPLOAD_TTL_SECONDS = int(os.environ.get('EATFIT_UPLOAD_TTL', 24 * 60 * 60))
+DEBUG_ARTIFACT_TTL_SECONDS = int(os.environ.get('EATFIT_DEBUG_ARTIFACT_TTL', 7 * 24 * 60 * 60))
+
+# Time between two sweeps
+SWEEP_INTERVAL_SECONDS = 15 * 60
+
+# Files the sweeper never deletes
+KEEP_FILES = {'.gitkeep'}
+
+
+class UploadStore:
+    """Content-addressed upload directory with background writes and references."""
+
+    def __init__(self, directory=UPLOAD_DIR, ttl=UPLOAD_TTL_SECONDS):
+        self.directory = directory
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-writer')
+        self._pending = {}  # name -> future of its background write
+        self._refs = {}  # name -> set of owners
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        """Path of a stored upload."""
+        return os.path.join(self.directory, name)
+
+    def save(self, data, filename):
+        """
+        Store an upload, writing it to disk in the background.
+
+        Args:
+            data: The uploaded bytes
+            filename: The client's file name; only its extension is kept
+
+        Returns:
+            str: The stored name (content hash plus extension)
+        """
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'jpg'
+        name = f"{content_hash(data)}.{extension}"
+
+        with self._lock:
+            if name in self._pending:
+                return name
+            if os.path.exists(self.path(name)):
+                self.touch(name)  # Duplicate upload, already stored
+                return name
+            future = self._executor.submit(self._write, data, self.path(name))
+            self._pending[name] = future
+        future.add_done_callback(lambda _: self._done(name, future))
+        return name
+
+    def wait(self, name, timeout=UPLOAD_WAIT_SECONDS):
+        """
+        Wait until a pending write of an upload has finished.
+
+        Returns:
+            bool: False if the write failed or did not finish in time
+        """
+        with self._lock:
+            future = self._pending.get(name)
+        if future is None:
+            return True
+        try:
+            future.result(timeout=timeout)
+            return True
+        except Exception as e:
+            print(f"Upload {name} not written: {str(e)}")
+            return False
+
+    def acquire(self, name, owner):
+        """Keep an upload from being swept until owner releases it."""
+        with self._lock:
+            self._refs.setdefault(name, set()).add(owner)
+
+    def release(self, name, owner):
+        """Drop owner's reference; the upload's TTL starts counting again."""
+        with self._lock:
+            owners = self._refs.get(name)
+            if owners is not None:
+                owners.discard(owner)
+                if not owners:
+                    del self._refs[name]
+        self.touch(name)
+
+    def touch(self, name):
+        """Mark an upload as used now (the file's mtime is its last use)."""
+        try:
+            os.utime(self.path(name))
+        except OSError:
+            pass
+
+    def sweep(self, now=None):
+        """
+        Delete uploads that are unreferenced and unused for longer than the TTL.
+
+        Returns:
+            int: Number of files deleted
+        """
+        cutoff = (now or time.time()) - self.ttl
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return removed
+
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name in KEEP_FILES:
+                continue
+            with self._lock:
+                # Partial writes are named "<name>.<thread>.tmp"
+                name = entry.name.rsplit('.', 2)[0] if entry.name.endswith('.tmp') else entry.name
+                if name in self._refs or name in self._pending:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _done(self, name, future):
+        with self._lock:
+            if self._pending.get(name) is future:
+                del self._pending[name]
+
+    @staticmethod
+    def _write(data, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class Sweeper:
+    """Daemon thread that periodically expires old uploads and debug artifacts."""
+
+    def __init__(self, store, interval=SWEEP_INTERVAL_SECONDS):
+        self.store = store
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='upload-sweeper', daemon=True)
+                self._thread.start()
+
+    def sweep_once(self):
+        removed = self.store.sweep()
+        if removed:
+            print(f"Removed {removed} expired uploads")
+        get_debug_sink().expire(DEBUG_ARTIFACT_TTL_SECONDS)
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep_once()
+            except Exception as e:
+                print(f"Upload sweep error: {str(e)}")
+            time.sleep(self.interval)
+
+
+_store = None
+_sweeper = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Get the process-wide upload store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UploadStore()
+        return _store
+
+
+def start_sweeper():
+    """Start the background sweeper for this process (once)."""
+    global _sweeper
+    store = get_upload_store()
+    with _store_lock:
+        if _sweeper is None:
+            _sweeper = Sweeper(store)
+    _sweeper.start()
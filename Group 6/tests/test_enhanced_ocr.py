@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from utils import image_processing
+from utils.image_processing import VARIANT_NAMES, VariantPipeline, enhanced_ocr
+
+
+class FakeScheduler:
+    """Runs every pass of a config before the next config, records nothing."""
+
+    def order(self, pairs):
+        return sorted(pairs, key=lambda pair: pair[1])
+
+    def record(self, *args):
+        pass
+
+    def maybe_save(self):
+        pass
+
+
+def test_per_config_only_has_configs_whose_passes_all_ran(monkeypatch):
+    ran = len(VARIANT_NAMES) + 1  # Every pass of config 0, one of config 1
+
+    def fake_fan_out(func, jobs, on_result, on_error=None, deadline=None):
+        for i, job in enumerate(jobs):
+            if i == ran:
+                return True
+            on_result(job, ('', {'fat': 1.0}, 1.0))
+        return False
+
+    monkeypatch.setattr(image_processing, 'fan_out', fake_fan_out)
+    monkeypatch.setattr(image_processing, 'get_scheduler', FakeScheduler)
+
+    per_config = {}
+    values, _ = enhanced_ocr(VariantPipeline(np.full((60, 80, 3), 255, np.uint8)), per_config=per_config)
+    assert values == {'fat': 1.0}
+    assert list(per_config) == [0]
@@ -0,0 +1,46 @@
+import pytest
+from utils.nutrient_extractor import scan, first_readings
+
+
+def values(text):
+    return {nutrient: value for nutrient, (value, _) in first_readings(scan(text)).items()}
+
+
+def test_energy_row_labelled_kj_is_not_kcal():
+    assert values("Energy (kJ) 1891 … Energy (kcal) 452")['energy_kcal'] == 452
+
+
+def test_energy_kj_and_kcal_on_one_row():
+    assert values("Energy 1891 kJ / 452 kcal")['energy_kcal'] == 452
+
+
+def test_label_does_not_swallow_the_next_label():
+    assert values("Fat, of which saturates 5 g") == {'saturated_fat': 5}
+    assert values("Carbohydrate of which sugars 10 g") == {'sugars': 10}
+
+
+def test_word_containing_a_label_is_not_a_label():
+    assert values("Saturates (fatty acids) 5 g") == {'saturated_fat': 5}
+
+
+def test_unit_in_brackets():
+    readings = scan("Sodium (mg) 400")
+    assert readings == [('sodium', 400.0, 'mg')]
+
+
+def test_full_label():
+    text = ("Energy 1891 kJ / 452 kcal\nFat 12 g\nof which saturates 5 g\nCarbohydrate 60 g\n"
+            "of which sugars 10 g\nFibre 3 g\nProtein 8 g\nSalt 1.2 g")
+    assert values(text) == {
+        'energy_kcal': 452, 'fat': 12, 'saturated_fat': 5, 'carbohydrates': 60,
+        'sugars': 10, 'fiber': 3, 'protein': 8, 'salt': 1.2,
+    }
+
+
+def test_parse_nutrition_regressions():
+    pytest.importorskip('cv2')
+    from utils.nutrition import parse_nutrition
+
+    assert parse_nutrition("Energy (kJ) 1891 … Energy (kcal) 452")['energy_kcal'] == 452
+    assert parse_nutrition("Fat, of which saturates 5 g")['saturated_fat'] == 5
+    assert parse_nutrition("Carbohydrate of which sugars 10 g")['sugars'] == 10
@@ -0,0 +1,69 @@
+import time
+import threading
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('requests')
+from utils import nutrition
+from utils.nutrition import process_with_config
+
+
+def test_partial_ocr_without_values_is_not_label_data(monkeypatch):
+    monkeypatch.setattr(nutrition, 'extract_text', lambda *args, **kwargs: {'ocr_partial': True})
+    data = process_with_config('label.jpg', 0)
+    assert data['ocr_partial'] is True
+    assert data['energy_kcal'] == 0 and data['sugars'] == 0
+
+
+def test_partial_ocr_keeps_its_values(monkeypatch):
+    monkeypatch.setattr(nutrition, 'extract_text',
+                        lambda *args, **kwargs: {'fat': 12.0, 'ocr_partial': True})
+    assert process_with_config('label.jpg', 0) == {'fat': 12.0, 'ocr_partial': True}
+
+
+class FakeIndex:
+    def lookup(self, categories):
+        return []
+
+
+class FakeClient:
+    """OFF client whose searches of 'en:stuck' hang until released."""
+
+    def __init__(self, release, started):
+        self.release = release
+        self.started = started
+
+    def get_product(self, barcode, fields=None):
+        category = 'en:stuck' if barcode == 'stuck' else 'en:snacks'
+        return {'categories_tags': [category], 'nutriments': {'sugars_100g': 30}, 'nova_group': 4}
+
+    def search(self, params):
+        if params['tag_0'] == 'en:stuck':
+            self.started.release()
+            self.release.wait(10)
+            return []
+        return [{'code': '1', 'product_name': 'Oat bar', 'image_url': 'http://img.invalid/1.jpg',
+                 'nutrition_grades': 'a', 'nutriments': {'sugars_100g': 5}}]
+
+
+def test_alternative_searches_do_not_wait_behind_other_requests(monkeypatch):
+    release = threading.Event()
+    started = threading.Semaphore(0)
+    monkeypatch.setattr(nutrition, 'get_off_client', lambda: FakeClient(release, started))
+    monkeypatch.setattr(nutrition, 'get_alternatives_index', FakeIndex)
+
+    stuck = [threading.Thread(target=nutrition.get_alternatives_by_category, args=('stuck', 'e'))
+             for _ in range(8)]
+    for thread in stuck:
+        thread.start()
+    try:
+        for _ in stuck:
+            assert started.acquire(timeout=5)
+        started = time.monotonic()
+        alternatives = nutrition.get_alternatives_by_category('snack', 'e')
+        assert time.monotonic() - started < 5
+        assert [a['product_name'] for a in alternatives] == ['Oat bar']
+    finally:
+        release.set()
+        for thread in stuck:
+            thread.join()
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('pytesseract')
+from utils import ocr_backends
+from utils.ocr_backends import build_config_string
+
+
+def test_no_tessdata_dir_by_default(monkeypatch):
+    monkeypatch.setattr(ocr_backends, 'TESSDATA_DIR', '')
+    assert build_config_string({'oem': 3, 'psm': 6, 'extra': '-l eng'}) == '--oem 3 --psm 6 -l eng'
+
+
+def test_tessdata_dir_added_when_it_exists(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr_backends, 'TESSDATA_DIR', str(tmp_path))
+    assert build_config_string({'oem': 3, 'psm': 6, 'extra': '-l eng'}) == \
+        f'--oem 3 --psm 6 --tessdata-dir "{tmp_path}" -l eng'
+
+
+def test_missing_tessdata_dir_is_dropped(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr_backends, 'TESSDATA_DIR', str(tmp_path / 'missing'))
+    cfg = {'oem': 1, 'psm': 3, 'extra': '--tessdata-dir "C:\\Tesseract\\tessdata" -l eng'}
+    assert build_config_string(cfg) == '--oem 1 --psm 3 -l eng'
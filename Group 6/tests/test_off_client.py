@@ -0,0 +1,112 @@
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from utils.off_client import CircuitBreaker, OFFClient, OFFUnavailable
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        if self._data is None:
+            raise ValueError("not JSON")
+        return self._data
+
+
+def make_client(*outcomes):
+    """A client whose requests raise or return the given outcomes in turn."""
+    client = OFFClient(base_url='http://off.invalid', backoff=0)
+    calls = []
+
+    def get(url, params=None, timeout=None):
+        outcome = outcomes[len(calls)]
+        calls.append(url)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    client.session.get = get
+    return client, calls
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_the_count():
+    breaker = CircuitBreaker(failures=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_breaker_allows_one_trial_after_the_break():
+    breaker = CircuitBreaker(failures=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one trial at a time
+
+    breaker.record_failure()  # Trial failed: open again
+    assert breaker.is_open
+    assert breaker.allow()
+    breaker.record_success()  # Trial succeeded: closed
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+def test_retries_connection_errors():
+    client, calls = make_client(requests.ConnectionError("refused"), FakeResponse(503),
+                                FakeResponse(200, {'status': 1}))
+    assert client.get_json('/x') == (200, {'status': 1})
+    assert len(calls) == 3
+    assert not client.breaker.is_open
+
+
+def test_non_json_body():
+    client, _ = make_client(FakeResponse(200))
+    assert client.get_json('/x') == (200, None)
+
+
+def test_gives_up_after_the_retries():
+    client, calls = make_client(*[requests.Timeout("slow")] * 3)
+    with pytest.raises(OFFUnavailable):
+        client.get_json('/x')
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ContentDecodingError("bad gzip"),
+    requests.exceptions.TooManyRedirects("loop"),
+    requests.exceptions.InvalidURL("bad url"),
+])
+def test_other_request_errors_fail_fast_and_end_the_trial(error):
+    client, calls = make_client(error, FakeResponse(200, {'status': 1}))
+    client.breaker = CircuitBreaker(failures=1, reset_seconds=0)
+    client.breaker.record_failure()  # Open; the next call is the half-open trial
+
+    with pytest.raises(OFFUnavailable):
+        client.get_json('/x')
+    assert len(calls) == 1  # Not retried
+
+    # The failed trial must not leave the circuit blocked for good
+    assert client.get_json('/x') == (200, {'status': 1})
+    assert not client.breaker.is_open
+
+
+def test_open_circuit_fails_without_a_request():
+    client, calls = make_client()
+    client.breaker = CircuitBreaker(failures=1, reset_seconds=60)
+    client.breaker.record_failure()
+    with pytest.raises(OFFUnavailable):
+        client.get_json('/x')
+    assert calls == []
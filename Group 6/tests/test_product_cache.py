@@ -0,0 +1,60 @@
+import time
+import pytest
+from utils import product_cache
+from utils.product_cache import ProductCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ProductCache(path=str(tmp_path / 'products.sqlite3'), ttl=100, miss_ttl=10)
+
+
+def test_never_fetched(cache):
+    assert cache.get('123') is None
+
+
+def test_fresh_then_stale(cache, monkeypatch):
+    cache.put('123', {'product_name': 'Oats'})
+    assert cache.get('123') == ({'product_name': 'Oats'}, True)
+
+    later = time.time() + 101
+    monkeypatch.setattr(product_cache.time, 'time', lambda: later)
+    # Stale entries are still returned, for when OFF can't be reached
+    assert cache.get('123') == ({'product_name': 'Oats'}, False)
+
+
+def test_miss_has_its_own_ttl(cache, monkeypatch):
+    cache.put('404', None)
+    assert cache.get('404') == (None, True)
+
+    later = time.time() + 11
+    monkeypatch.setattr(product_cache.time, 'time', lambda: later)
+    assert cache.get('404') == (None, False)
+
+
+def test_fields_cover_the_caller(cache):
+    cache.put('123', {'product_name': 'Oats', 'brands': 'Acme'}, fields=['product_name', 'brands'])
+    assert cache.get('123', ['brands'])[1]
+    assert not cache.get('123', ['brands', 'nutriments'])[1]
+
+    # A whole document (no field list) covers every caller
+    cache.put('456', {'product_name': 'Rice'})
+    assert cache.get('456', ['nutriments'])[1]
+
+
+def test_callers_get_their_own_copy(cache):
+    cache.put('123', {'nutriments': {'fat_100g': 1}})
+    product, _ = cache.get('123')
+    product['nutriments']['fat_100g'] = 99
+    assert cache.get('123')[0] == {'nutriments': {'fat_100g': 1}}
+
+
+def test_shared_between_instances_and_invalidated(tmp_path):
+    path = str(tmp_path / 'products.sqlite3')
+    first, second = ProductCache(path=path), ProductCache(path=path)
+    first.put('123', {'product_name': 'Oats'})
+    assert second.get('123') == ({'product_name': 'Oats'}, True)
+
+    first.invalidate('123')
+    assert first.get('123') is None
+    assert second.get('123', memory=False) is None
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+from utils import single_flight
+from utils.single_flight import FileLock, SingleFlight
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / 'key.lock')
+    first, second = FileLock(path), FileLock(path)
+    assert first.acquire(timeout=0)
+    assert not second.acquire(timeout=0.1)
+    first.release()
+    assert second.acquire(timeout=0)
+    second.release()
+    assert not os.path.exists(path)
+
+
+def test_file_lock_waits_for_release(tmp_path):
+    path = str(tmp_path / 'key.lock')
+    holder = FileLock(path)
+    holder.acquire()
+    threading.Timer(0.2, holder.release).start()
+
+    started = time.monotonic()
+    waiter = FileLock(path)
+    assert waiter.acquire(timeout=5)
+    assert time.monotonic() - started >= 0.15
+    waiter.release()
+
+
+def test_stale_lock_is_broken(tmp_path):
+    path = str(tmp_path / 'key.lock')
+    FileLock(path).acquire()  # Left behind by a crashed worker
+    old = time.time() - single_flight.LOCK_STALE_SECONDS - 1
+    os.utime(path, (old, old))
+
+    lock = FileLock(path)
+    assert lock.acquire(timeout=0)
+    lock.release()
+
+
+def test_concurrent_callers_share_one_call(tmp_path):
+    flight = SingleFlight('test', lock_dir=str(tmp_path))
+    calls = []
+    results = []
+    gate = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        gate.wait(5)
+        return {'product_name': 'Oats'}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('123', fetch))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)  # Let every follower find the leader's call
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{'product_name': 'Oats'}] * 8
+    # Each caller got its own copy
+    assert len({id(result) for result in results}) == 8
+    assert os.listdir(tmp_path) == []
+
+
+def test_followers_get_the_leaders_exception(tmp_path):
+    flight = SingleFlight('test', lock_dir=str(tmp_path))
+    gate = threading.Event()
+    errors = []
+
+    def fetch():
+        gate.wait(5)
+        raise ValueError("OFF down")
+
+    def call():
+        try:
+            flight.do('123', fetch)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == ["OFF down"] * 4
+
+
+def test_recheck_after_waiting_for_another_worker(tmp_path):
+    # Two instances with one lock directory act like two workers
+    worker_a = SingleFlight('test', lock_dir=str(tmp_path))
+    worker_b = SingleFlight('test', lock_dir=str(tmp_path))
+    shared_store = {}
+    gate = threading.Event()
+    b_calls = []
+
+    def fetch_a():
+        gate.wait(5)
+        shared_store['123'] = 'from a'
+        return 'from a'
+
+    def recheck():
+        return ('123' in shared_store), shared_store.get('123')
+
+    def fetch_b():
+        b_calls.append(1)
+        return 'from b'
+
+    leader = threading.Thread(target=worker_a.do, args=('123', fetch_a))
+    leader.start()
+    time.sleep(0.1)
+    threading.Timer(0.2, gate.set).start()
+    assert worker_b.do('123', fetch_b, recheck) == 'from a'
+    assert b_calls == []
+    leader.join(5)
+
+
+def test_gives_up_waiting_and_calls_itself(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileLock.acquire, '__defaults__', (0.1,))
+    flight = SingleFlight('test', lock_dir=str(tmp_path))
+    held = FileLock(flight._lock_path('123'))
+    held.acquire()
+    try:
+        assert flight.do('123', lambda: 'fetched') == 'fetched'
+    finally:
+        held.release()